@@ -7,8 +7,6 @@ import glob
 import re
 import importlib.util
 import numpy as np
-import whisper
-import ollama
 import threading
 import subprocess
 import uuid 
@@ -16,20 +14,28 @@ import sounddevice as sd
 from flask import Flask, request, jsonify
 from datetime import datetime
 import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 import config
-import queue
+from wakeword import PhantasmaEngine, build_trackers, build_gate
+from telemetry_utils import WAKEWORD_METRICS, SKILL_METRICS
+from routing_utils import TriggerIndex, RetrievalClassifier
+from llm_utils import LLM, SentenceChunker, build_llm_prompt
+from stt_utils import clean_transcript, StreamingTranscriber, load_stt_backend, load_command_recognizer
 
 # --- FALLBACKS ---
-try: from audio_utils import play_tts, record_audio, clean_old_cache
+try: from audio_utils import play_tts, record_audio, clean_old_cache, CaptureService, SpeechPipeline
 except ImportError: 
+    CaptureService = None
+    SpeechPipeline = None
     def play_tts(t, **k): print(f"[TTS] {t}")
-    def record_audio(): return np.zeros(16000, dtype=np.int16)
-try: from data_utils import setup_database, retrieve_from_rag, get_cached_response, save_cached_response
+    def record_audio(*a, **k): return np.zeros(16000, dtype=np.int16)
+try: from data_utils import setup_database, retrieve_from_rag, get_cached_response, save_cached_response, cache_stats
 except ImportError: 
     def setup_database(): pass
     def retrieve_from_rag(p): return ""
     def get_cached_response(p): return None
     def save_cached_response(p, r): pass
+    def cache_stats(): return {}
 try: from tools import search_with_searxng
 except ImportError: 
     def search_with_searxng(p): return ""
@@ -38,9 +44,14 @@ except ImportError:
 CURRENT_REQUEST_ID = None  
 IS_SPEAKING = False
 app = Flask(__name__)
-whisper_model = None
-ollama_client = None
+stt_backend = None
+command_recognizer = None
 SKILLS_LIST = []
+ROUTING_INDEX = TriggerIndex([])
+SKILL_POOL = None
+RETRIEVAL_POOL = ThreadPoolExecutor(max_workers=6, thread_name_prefix="retrieval")
+RETRIEVAL_CLASSIFIER = RetrievalClassifier()
+PARTIAL_TRANSCRIPT = {"req_id": None, "text": "", "final": True}
 
 # --- UTILITÁRIOS ---
 def stop_audio_output():
@@ -64,6 +75,32 @@ def safe_play_tts(text, use_cache=True, request_id=None, speak=True):
     play_tts(text, use_cache=use_cache)
     IS_SPEAKING = False
 
+def speak_llm_stream(messages, options, request_id):
+    """
+    Consome o stream do LLM e fala cada frase assim que fica completa (SpeechPipeline).
+    Devolve (texto, completo): texto None se nada chegou ou o pedido foi interrompido;
+    completo False se o stream caiu a meio (o que já foi dito não deve ir para a cache).
+    IS_SPEAKING só fica ligado enquanto o aplay toca, para a hotword poder interromper durante a geração.
+    """
+    def is_active(): return request_id == "API_REQ" or request_id == CURRENT_REQUEST_ID
+    def on_playing(playing):
+        global IS_SPEAKING
+        IS_SPEAKING = playing and is_active()
+    stop_audio_output()
+    speaker, chunker, parts, t0 = SpeechPipeline(is_active, on_playing), SentenceChunker(), [], time.time()
+    complete = True
+    try:
+        for token in LLM.chat_stream(messages, options=options):
+            if not is_active(): break
+            parts.append(token)
+            for sentence in chunker.feed(token): speaker.feed(sentence)
+        for sentence in chunker.flush(): speaker.feed(sentence)
+    except Exception: complete = False
+    finally: speaker.finish()
+    if speaker.first_audio_at: print(f"⏱️ Primeiro áudio da resposta em {speaker.first_audio_at - t0:.2f}s")
+    if not is_active(): return None, False
+    return "".join(parts).strip() or None, complete
+
 def force_volume_down(card_index):
     """ 
     Aplica o volume definido no config e DESLIGA o AGC (Auto Gain Control).
@@ -110,33 +147,9 @@ def find_working_samplerate(device_index):
         except: pass
     return 16000
 
-# --- MOTOR PHANTASMA ---
-class PhantasmaEngine:
-    def __init__(self, model_paths):
-        self.ready = False
-        try:
-            from openwakeword.model import Model
-            # Carrega modelos ONNX
-            self.model = Model(wakeword_models=model_paths, inference_framework="onnx")
-            self.ready = True
-            print(f"👻 Motor Phantasma: ONLINE")
-            print(f"   Modelos: {model_paths}")
-        except Exception as e:
-            print(f"❌ Erro Motor: {e}")
-
-    def predict(self, audio_chunk_int16):
-        if not self.ready: return 0.0
-        # openWakeWord espera int16 ou float32
-        prediction = self.model.predict(audio_chunk_int16)
-        if prediction: return max(prediction.values())
-        return 0.0
-
-    def reset(self):
-        if self.ready: self.model.reset()
-
 # --- SKILLS & STT ---
 def load_skills():
-    global SKILLS_LIST
+    global SKILLS_LIST, ROUTING_INDEX
     SKILLS_LIST = []
     if not os.path.exists(config.SKILLS_DIR): return
     sys.path.append(config.SKILLS_DIR)
@@ -150,24 +163,33 @@ def load_skills():
             SKILLS_LIST.append({
                 "name": name, "handle": getattr(mod, 'handle', None),
                 "triggers": getattr(mod, 'TRIGGERS', []), "trigger_type": getattr(mod, 'TRIGGER_TYPE', 'contains'),
-                "module": mod, "get_status": getattr(mod, 'get_status_for_device', None)
+                "module": mod, "get_status": getattr(mod, 'get_status_for_device', None),
+                "speculative": getattr(mod, 'SPECULATIVE', False) # Só corre à frente da vez quem o declara
             })
         except: pass
+    # Índice de routing compilado uma só vez (triggers -> skills, prioridade OFF pré-calculada)
+    ROUTING_INDEX = TriggerIndex(SKILLS_LIST, word_boundaries=getattr(config, 'ROUTING_WORD_BOUNDARIES', False))
+
+def _stt_transcribe(audio_data, initial_prompt=None):
+    return stt_backend.transcribe(audio_data, initial_prompt=initial_prompt)
 
 def transcribe_audio(audio_data):
-    if audio_data.size == 0 or whisper_model is None: return ""
+    if audio_data.size == 0 or stt_backend is None: return ""
     try:
         initial = getattr(config, 'WHISPER_INITIAL_PROMPT', None)
-        res = whisper_model.transcribe(audio_data, language='pt', fp16=False, initial_prompt=initial)
-        text = res['text'].strip()
-        hallucinations = [".", "?", "Obrigado", "Sous-titres"]
-        if any(h in text for h in hallucinations) and len(text) < 5: return ""
-        if hasattr(config, 'PHONETIC_FIXES'):
-            for k, v in config.PHONETIC_FIXES.items():
-                if k in text.lower(): text = re.sub(re.escape(k), v, text, flags=re.IGNORECASE)
-        return text
+        return clean_transcript(_stt_transcribe(audio_data, initial))
     except: return ""
 
+def _publish_partial(req_id, text, final=False):
+    PARTIAL_TRANSCRIPT.update({"req_id": req_id, "text": text, "final": final})
+    if not final: print(f"📝 Parcial: {text}")
+
+def start_streaming_transcription(req_id):
+    """ Transcritor incremental para a gravação atual (None se estiver desligado no config). """
+    if stt_backend is None or not getattr(config, 'STT_STREAMING', False): return None
+    _publish_partial(req_id, "")
+    return StreamingTranscriber(_stt_transcribe, on_partial=lambda t: _publish_partial(req_id, t))
+
 def sanitize_llm_context(context):
     if not context or not isinstance(context, str): return ""
     
@@ -186,6 +208,101 @@ def sanitize_llm_context(context):
 
     return context.strip()
 
+# --- ROUTING DE SKILLS ---
+def _run_skill(s, p_low, prompt):
+    """ Corre o handle e normaliza a resposta (texto ou None se a skill recusou). A telemetria é registada pelo router. """
+    try: resp = s['handle'](p_low, prompt)
+    except Exception as e:
+        print(f"⚠️ Skill '{s['name']}' falhou: {e}")
+        raise
+    txt = (resp.get("response", "") if isinstance(resp, dict) else resp) if resp else None
+    return txt or None
+
+def _skill_deadline(s):
+    deadlines = getattr(config, 'SKILL_DEADLINES', {}) or {}
+    return deadlines.get(s['name'], getattr(s['module'], 'SKILL_TIMEOUT', getattr(config, 'ROUTING_SKILL_DEADLINE', 8.0)))
+
+def _evaluate_sequential(candidates, p_low, prompt):
+    for s in candidates:
+        t0 = time.perf_counter()
+        try: txt = _run_skill(s, p_low, prompt)
+        except Exception as e:
+            SKILL_METRICS.record(s['name'], 'error', time.perf_counter() - t0, e)
+            continue
+        SKILL_METRICS.record(s['name'], 'answered' if txt else 'declined', time.perf_counter() - t0)
+        if txt: return s, txt
+    return None, None
+
+def _evaluate_parallel(candidates, p_low, prompt):
+    """
+    Corre as skills candidatas em simultâneo num pool limitado e escolhe a primeira
+    (pela ordem de prioridade) que responder. Cada skill tem um prazo contado a partir
+    do momento em que começa a correr; as que perdem são ignoradas (as threads não
+    podem ser mortas, mas já ninguém espera por elas). Só as skills com SPECULATIVE = True
+    arrancam logo; as outras (atuam em dispositivos ou custam dinheiro) só correm quando
+    todas as anteriores recusaram.
+    """
+    global SKILL_POOL
+    if SKILL_POOL is None: SKILL_POOL = ThreadPoolExecutor(max_workers=getattr(config, 'ROUTING_WORKERS', 4), thread_name_prefix="skill")
+    started, finished = {}, {}
+
+    def timed(s):
+        started[s['name']] = time.monotonic()
+        try: return _run_skill(s, p_low, prompt)
+        finally: finished[s['name']] = time.monotonic()
+
+    def elapsed(s): return finished[s['name']] - started[s['name']] if s['name'] in finished else None
+
+    futures = {s['name']: SKILL_POOL.submit(timed, s) for s in candidates if s.get('speculative')}
+    # Prazo global (inclui a espera na fila): skills penduradas podem ocupar os workers todos
+    total = getattr(config, 'ROUTING_TOTAL_DEADLINE', 30.0)
+    route_end = time.monotonic() + total
+    try:
+        for s in candidates:
+            fut = futures.get(s['name']) or futures.setdefault(s['name'], SKILL_POOL.submit(timed, s))
+            deadline = _skill_deadline(s)
+            try:
+                # Enquanto está na fila do pool o prazo da skill ainda não conta (só o global)
+                while True:
+                    if fut.done(): txt = fut.result(); break # Já acabou enquanto esperávamos pelas anteriores
+                    start = started.get(s['name'])
+                    limit = route_end if start is None else min(start + deadline, route_end)
+                    now = time.monotonic()
+                    if now >= limit: raise FutureTimeout()
+                    try: txt = fut.result(timeout=min(limit - now, 0.05) if start is None else limit - now); break
+                    except FutureTimeout: continue
+            except FutureTimeout:
+                # Só o router regista o resultado: se a skill acabar depois, já não conta como resposta
+                SKILL_METRICS.record(s['name'], 'timeout')
+                if time.monotonic() >= route_end:
+                    print(f"⏱️ Routing excedeu o prazo global de {total}s. Segue para o LLM.")
+                    return None, None
+                print(f"⏱️ Skill '{s['name']}' excedeu o prazo de {deadline}s. A ignorar.")
+                continue
+            except Exception as e:
+                SKILL_METRICS.record(s['name'], 'error', elapsed(s), e)
+                continue
+            SKILL_METRICS.record(s['name'], 'answered' if txt else 'declined', elapsed(s))
+            if txt:
+                # As especulativas de menor prioridade correram mas a resposta delas foi deitada fora
+                for other in candidates[candidates.index(s) + 1:]:
+                    if other['name'] in started: SKILL_METRICS.record(other['name'], 'preempted')
+                return s, txt
+        return None, None
+    finally:
+        for fut in futures.values(): fut.cancel() # As que ainda não arrancaram já não correm
+
+RETRIEVAL_DEADLINES = {"cache": 1.5, "rag": 2.0, "web": 4.0}
+
+def _collect_source(future, name, t0):
+    """ Resultado de uma fonte de contexto, se chegar dentro do prazo (contado desde t0). Senão None. """
+    if future is None: return None
+    deadline = {**RETRIEVAL_DEADLINES, **(getattr(config, 'RETRIEVAL_DEADLINES', {}) or {})}[name]
+    try: return future.result(timeout=max(0.0, t0 + deadline - time.monotonic()))
+    except FutureTimeout: print(f"⏱️ Fonte '{name}' não chegou em {deadline}s. Segue sem ela.")
+    except Exception as e: print(f"⚠️ Fonte '{name}' falhou: {e}")
+    return None
+
 def route_and_respond(prompt, req_id, speak=True):
     global CURRENT_REQUEST_ID
     if not prompt or not str(prompt).strip(): return "" # Proteção contra vazio
@@ -201,104 +318,97 @@ def route_and_respond(prompt, req_id, speak=True):
     skill_context = ""
 
     # --- 1. SKILLS ---
-    OFF_KEYWORDS = ['desliga', 'para', 'apaga', 'fecha', 'recolhe', 'stop', 'cancelar']
-    is_off_intent = any(k in p_low for k in OFF_KEYWORDS)
-
-    def get_priority(skill):
-        if not is_off_intent: return 0
-        skill_trigs = [str(tr).lower() for tr in skill.get('triggers', [])]
-        # CORREÇÃO: k in tr (onde tr é o trigger da lista skill_trigs)
-        return 1 if any(k in tr for tr in skill_trigs for k in OFF_KEYWORDS) else 0
+    # Um varrimento do índice dá as skills que casaram, já pela ordem de prioridade (OFF primeiro)
+    candidates = [s for s in ROUTING_INDEX.candidates(p_low) if s['handle']]
+    SKILL_METRICS.record_request([s['name'] for s in candidates])
+    if getattr(config, 'ROUTING_MODE', 'sequential') == 'parallel' and len(candidates) > 1:
+        s, txt = _evaluate_parallel(candidates, p_low, prompt)
+    else: s, txt = _evaluate_sequential(candidates, p_low, prompt)
+    if candidates and not txt: SKILL_METRICS.record_fallthrough()
 
-    sorted_skills = sorted(SKILLS_LIST, key=get_priority, reverse=True)
-    
-    for s in sorted_skills:
-        trigs = [t.lower() for t in s['triggers']]
-        match = any(p_low.startswith(t) for t in trigs) if s['trigger_type'] == 'startswith' else any(t in p_low for t in trigs)
-        
-        if match and s['handle']:
-            try:
-                resp = s['handle'](p_low, prompt)
-                if not resp: continue
-                txt = resp.get("response", "") if isinstance(resp, dict) else resp
-                if not txt: continue
-
-                if is_opinion_query:
-                    print(f"🔧 Skill '{s['name']}' proveu dados para a opinião.")
-                    skill_context = f"Facto apurado localmente: {txt}"
-                    break 
-                else:
-                    print(f"🔧 Skill '{s['name']}' resolveu diretamente.")
-                    safe_play_tts(txt, False, req_id, (speak or s['name'] == 'skill_tts'))
-                    return txt
-            except: continue
-    # --- 2. CACHE ---
-    cached = get_cached_response(prompt)
+    if txt:
+        if is_opinion_query:
+            print(f"🔧 Skill '{s['name']}' proveu dados para a opinião.")
+            skill_context = f"Facto apurado localmente: {txt}"
+        else:
+            print(f"🔧 Skill '{s['name']}' resolveu diretamente.")
+            safe_play_tts(txt, False, req_id, (speak or s['name'] == 'skill_tts'))
+            return txt
+    # --- 2. CACHE + RECOLHA DE CONTEXTO (em paralelo) ---
+    # Conversa não precisa de memórias nem de web; perguntas pessoais não precisam de web (routing_utils)
+    need = RETRIEVAL_CLASSIFIER.decide(prompt)
+    t0 = time.monotonic()
+    f_cache = RETRIEVAL_POOL.submit(get_cached_response, prompt)
+    f_rag = RETRIEVAL_POOL.submit(retrieve_from_rag, prompt) if need["memory"] else None
+
+    cached = _collect_source(f_cache, "cache", t0)
     if cached:
+        if f_rag: f_rag.cancel()
         safe_play_tts(cached, True, req_id, speak)
         return cached
 
+    # A web (pedido externo) só sai depois de a cache falhar.
+    # Se uma skill já deu o resultado, evitamos pesquisa web desnecessária
+    f_web = None if (skill_context or not need["web"]) else RETRIEVAL_POOL.submit(search_with_searxng, prompt)
+
     # --- 3. INFERÊNCIA LLM (Failover Host -> Local) ---
+    # O "Deixa ver..." toca enquanto o RAG e a web acabam em fundo
     safe_play_tts("Deixa ver...", True, req_id, speak)
     
-    # Recuperação e sanitização de dados
-    rag = sanitize_llm_context(retrieve_from_rag(prompt))
+    # Recuperação e sanitização de dados (o que não chegou a tempo fica de fora)
+    rag = sanitize_llm_context(_collect_source(f_rag, "rag", t0))
+    web = sanitize_llm_context(_collect_source(f_web, "web", t0))
+    print(f"🧭 Contexto: memórias {'sim' if f_rag else 'não'} | web {'sim' if f_web else 'não'} ({need['source']})")
+    RETRIEVAL_CLASSIFIER.log(prompt, need, rag_hits=bool(rag.strip()), web_hits=bool(web.strip()), skill=bool(skill_context))
     
-    # Se uma skill já deu o resultado, evitamos pesquisa web desnecessária
-    web = "" if skill_context else sanitize_llm_context(search_with_searxng(prompt))
-    
-    inference_targets = [
-        (getattr(config, 'OLLAMA_HOST_PRIMARY', None), getattr(config, 'OLLAMA_MODEL_PRIMARY', 'llama3')),
-        (getattr(config, 'OLLAMA_HOST_FALLBACK', 'http://localhost:11434'), getattr(config, 'OLLAMA_MODEL_FALLBACK', 'llama3'))
-    ]
-
-    ans = None
-    sys_prompt = getattr(config, 'SYSTEM_PROMPT', '')
-    
-    # Construção do prompt final com injeção de factos das skills
-    full_p = (
-            f"{sys_prompt}\n\n"
-            "### CONHECIMENTO DISPONÍVEL (Usa apenas para factos):\n"
-            f"{rag}\n{web}\n{skill_context}\n\n"
-            "### INSTRUÇÃO DE RESPOSTA:\n"
-            "Responde de forma fluida e melancólica. NÃO uses cabeçalhos como '**Sombra**' ou '**Fim**'. "
-            "NÃO digas que a pergunta é irrelevante. Sê um assistente, não um juiz.\n\n"
-            f"Utilizador: {prompt}"
-            )
-    for host, model in inference_targets:
-        if not host: continue
-        try:
-            print(f"🤖 Tentativa Ollama: {host} (Modelo: {model})")
-            temp_client = ollama.Client(host=host)
-            resp = temp_client.chat(
-                model=model, 
-                messages=[{'role':'user', 'content':full_p}],
-                options={
-                    "repeat_penalty": 1.4,  # Aumentado para evitar repetições góticas
-                    "temperature": 0.6,     # Ligeiramente reduzido para ser mais factual
-                    "num_ctx": 8192,
-                    "top_p": 0.9,
-                    "stop": ["Utilizador:", "###", "Fim", "Sombra"] # Força a paragem se ele tentar usar os headers
-                }
-            )
-            ans = resp['message']['content']
-            if ans: break 
-        except Exception as e:
-            print(f"⚠️ Falha no host {host}: {e}. A tentar fallback...")
-            continue 
+    messages, num_ctx = build_llm_prompt(prompt, rag, web, skill_context)
+    options = {
+        "repeat_penalty": 1.4,  # Aumentado para evitar repetições góticas
+        "temperature": 0.6,     # Ligeiramente reduzido para ser mais factual
+        "num_ctx": num_ctx,     # O menor que cabe (llm_utils.build_llm_prompt)
+        "top_p": 0.9,
+        "stop": ["Utilizador:", "###", "Fim", "Sombra"] # Força a paragem se ele tentar usar os headers
+    }
+    # Failover Host -> Local com clientes persistentes e circuit breaker (llm_utils)
+    streamed = speak and SpeechPipeline is not None and getattr(config, 'LLM_STREAMING', True)
+    if streamed: ans, complete = speak_llm_stream(messages, options, req_id)
+    else: ans, complete = LLM.chat(messages, options=options), True
 
     if ans:
         if req_id != CURRENT_REQUEST_ID: return
-        save_cached_response(prompt, ans)
-        safe_play_tts(ans, False, req_id, speak)
+        if complete: save_cached_response(prompt, ans)
+        else: print("⚠️ Resposta cortada a meio: não vai para a cache.")
+        if not streamed: safe_play_tts(ans, False, req_id, speak)
         return ans
+    if streamed and req_id != CURRENT_REQUEST_ID: return
     
     fallback_err = "As minhas sombras de processamento estão inalcançáveis de momento."
     safe_play_tts(fallback_err, False, req_id, speak)
     return fallback_err
 
-def process_command_thread(audio, req_id):
-    txt = transcribe_audio(audio)
+def _skill_matches(text):
+    """ True se o texto ativa pelo menos uma skill (o caminho rápido só serve comandos). """
+    return any(s['handle'] for s in ROUTING_INDEX.candidates(text.lower()))
+
+def fast_command_transcribe(audio):
+    """ Tenta o reconhecedor de gramática fechada. Devolve o texto ou None (usar Whisper). """
+    if command_recognizer is None or audio.size == 0: return None
+    try:
+        t0 = time.time()
+        text, conf = command_recognizer.recognize(audio)
+        ok = conf >= getattr(config, 'STT_FAST_PATH_CONFIDENCE', 0.85) and _skill_matches(text)
+        print(f"⚡ STT rápido: '{text}' (conf {conf:.2f}, {(time.time() - t0) * 1000:.0f} ms) -> {'aceite' if ok else 'Whisper'}")
+        return text if ok else None
+    except Exception as e:
+        print(f"⚠️ STT rápido falhou: {e}")
+        return None
+
+def process_command_thread(audio, req_id, stt=None):
+    txt = fast_command_transcribe(audio)
+    if txt:
+        if stt: stt.cancel()
+    else: txt = stt.result() if stt else transcribe_audio(audio)
+    if stt: _publish_partial(req_id, txt, final=True)
     if txt:
         print(f"🗣️  Ouvi: {txt}")
         route_and_respond(txt, req_id, speak=True)
@@ -353,6 +463,18 @@ def api_action():
     d = request.json
     return jsonify({"status":"ok", "response": route_and_respond(f"{d.get('action')} o {d.get('device')}", "API_REQ", False)})
 
+@app.route("/metrics")
+def api_metrics():
+    return jsonify({"status": "ok", "wakeword": WAKEWORD_METRICS.snapshot(), "skills": SKILL_METRICS.snapshot(), "cache": cache_stats(), "llm_hosts": LLM.status(), "retrieval": RETRIEVAL_CLASSIFIER.snapshot()})
+
+@app.route("/skills/stats")
+def api_skill_stats():
+    return jsonify({"status": "ok", **SKILL_METRICS.snapshot()})
+
+@app.route("/stt/partial")
+def api_stt_partial():
+    return jsonify({"status": "ok", **PARTIAL_TRANSCRIPT})
+
 @app.route("/help")
 def get_help():
     cmds = {"diz": "TTS"}
@@ -367,8 +489,9 @@ def main():
     
     if not config.WAKEWORD_MODELS: print("❌ WAKEWORD_MODELS vazio!"); return
     
-    engine = PhantasmaEngine(config.WAKEWORD_MODELS)
+    engine = PhantasmaEngine(config.WAKEWORD_MODELS, gate=build_gate())
     if not engine.ready: return
+    WAKEWORD_METRICS.gate = engine.gate
 
     # Config Audio
     device_in = getattr(config, 'ALSA_DEVICE_IN', 0)
@@ -377,109 +500,121 @@ def main():
     # Negociar sample rate
     DETECTED_RATE = find_working_samplerate(device_in)
     
-    # openWakeWord prefere 16000. Se o hardware só der 48k, fazemos downsample.
-    DOWNSAMPLE_FACTOR = 1
-    if DETECTED_RATE == 48000: DOWNSAMPLE_FACTOR = 3
-    elif DETECTED_RATE == 32000: DOWNSAMPLE_FACTOR = 2
-    
     # Chunk padrão do openWakeWord é 1280 samples (80ms a 16khz)
     CHUNK_SIZE = 1280 
-    # Tamanho a ler do hardware
-    READ_SIZE = CHUNK_SIZE * DOWNSAMPLE_FACTOR
     
     debug = getattr(config, 'DEBUG_MODE', False)
-    # Valor padrão mais alto para filtrar TV, confiando no volume de input mais alto
-    thresh = getattr(config, 'WAKEWORD_CONFIDENCE', 0.7) 
-    persistence = getattr(config, 'WAKEWORD_PERSISTENCE', 4)
+    preroll_ms = getattr(config, 'COMMAND_PREROLL_MS', 0)
 
-    print(f"👻 A ouvir no device {device_in} @ {DETECTED_RATE}Hz -> Fator {DOWNSAMPLE_FACTOR}x")
-    print(f"   (Threshold: {thresh}, Persistence: {persistence})")
+    # Stream único e permanente: a hotword e a gravação do comando subscrevem o mesmo
+    # device (sem segundo open do ALSA). O resample para 16 kHz é feito pelo serviço.
+    capture = CaptureService(device_in, DETECTED_RATE, CHUNK_SIZE, preroll_ms=preroll_ms)
+    print(f"👻 A ouvir no device {device_in} @ {DETECTED_RATE}Hz -> 16000Hz ({capture.resampler.up}/{capture.resampler.down})")
 
-    streak = 0
-    patience = 0 # Tolerância para falhas breves
-    MAX_PATIENCE = 2 # Quantos frames podemos "perder" sem zerar o streak
+    # Um tracker por modelo (threshold/persistência/paciência/ação em WAKEWORD_SETTINGS)
+    trackers = build_trackers(engine.model_names)
+    for tr in trackers:
+        print(f"   {tr.name}: Threshold {tr.threshold}, Persistence {tr.persistence}, Paciência {tr.max_patience}, Ação '{tr.action}'")
     
     cooldown = 0
-    audio_queue = queue.Queue()
-
-    def audio_callback(indata, frames, time, status):
-        if status: print(f"⚠️ Audio Status: {status}", file=sys.stderr)
-        audio_queue.put(indata.copy())
+    # Ring buffer pré-alocado: a captura escreve, o motor lê sem alocar por chunk.
+    # Se o CPU estiver preso (Whisper/Ollama), o áudio velho é descartado.
+    wake_ring = None
+    audio_16k = np.zeros(CHUNK_SIZE, dtype=np.int16)
     
     while True:
         try:
-            with sd.InputStream(device=device_in, channels=1, samplerate=DETECTED_RATE, 
-                                dtype='int16', blocksize=READ_SIZE, callback=audio_callback):
-                
-                print(f"👂 Stream Ativo")
+            if wake_ring is None:
+                capture.start()
+                wake_ring = capture.subscribe(max_backlog_ms=getattr(config, 'WAKEWORD_MAX_BACKLOG_MS', 400))
+
+            while True:
+                dropped = wake_ring.read_into(audio_16k, timeout=2.0)
+                if dropped is None: continue # A captura reabre o stream sozinha
+                if dropped and debug: print(f"⏭️ Descartadas {dropped} amostras atrasadas")
+
+                if IS_SPEAKING or time.time() < cooldown: 
+                    for tr in trackers: tr.reset()
+                    continue
+
+                # Previsão (todos os modelos numa só chamada)
+                t0 = time.perf_counter()
+                scores = engine.predict(audio_16k)
+                WAKEWORD_METRICS.record_chunk(time.perf_counter() - t0, scores, wake_ring.backlog(), dropped, scored=engine.last_scored)
+                score = max(scores.values()) if scores else 0.0
                 
-                while True:
-                    chunk = audio_queue.get()
-                    audio_raw = np.frombuffer(chunk, dtype=np.int16)
-
-                    # Downsample manual se necessário (simples decimação)
-                    if DOWNSAMPLE_FACTOR > 1: audio_resampled = audio_raw[::DOWNSAMPLE_FACTOR]
-                    else: audio_resampled = audio_raw
-
-                    if IS_SPEAKING or time.time() < cooldown: 
-                        streak=0; patience=0; continue
-
-                    # Previsão
-                    score = engine.predict(audio_resampled)
-                    
-                    # Log visual (Debug)
-                    if debug or (score > 0.3):
-                        bar = "█" * int(score * 20)
-                        print(f"Score:{score:.4f} | Streak:{streak} {bar}")
-
-                    # --- LÓGICA DE DETECÇÃO COM TOLERÂNCIA ---
-                    if score >= thresh:
-                        streak += 1
-                        patience = MAX_PATIENCE # Reset da paciência se acertou
-                    else:
-                        if streak > 0 and patience > 0:
-                            patience -= 1 # Não zera o streak, apenas gasta paciência
-                            if debug: print(f"   (Paciência: {patience})")
-                        else:
-                            streak = 0
-                            patience = 0 # Zera tudo
-                    # ----------------------------------------
-
-                    if streak >= persistence:
-                        print(f"\n⚡ WAKEWORD DETETADA! (Score final: {score:.2f})")
-                        stop_audio_output()
-                        if is_quiet_time(): streak=0; engine.reset(); continue
-                        break
+                # Log visual (Debug)
+                if debug or (score > 0.3):
+                    bar = "█" * int(score * 20)
+                    detail = " ".join(f"{tr.name}={scores.get(tr.name, 0.0):.2f}/{tr.streak}" for tr in trackers)
+                    print(f"Score:{score:.4f} | {detail} {bar}")
+
+                # --- LÓGICA DE DETECÇÃO COM TOLERÂNCIA (por modelo) ---
+                fired = [tr for tr in trackers if tr.update(scores.get(tr.name, 0.0))]
+                for tr in trackers: WAKEWORD_METRICS.record_event(tr.name, tr.last_event)
+                # ----------------------------------------
+
+                if fired:
+                    winner = max(fired, key=lambda tr: scores.get(tr.name, 0.0))
+                    print(f"\n⚡ WAKEWORD DETETADA! ({winner.name}, Score final: {scores.get(winner.name, 0.0):.2f})")
+                    quiet = is_quiet_time()
+                    WAKEWORD_METRICS.record_detection(winner.name, scores.get(winner.name, 0.0), quiet)
+                    stop_audio_output()
+                    if quiet:
+                        for tr in trackers: tr.reset()
+                        engine.reset(); continue
+                    break
             
             # --- Ação ---
-            with audio_queue.mutex: audio_queue.queue.clear()
-            
             req_id = str(uuid.uuid4())[:8]
             CURRENT_REQUEST_ID = req_id
-            engine.reset(); streak=0; patience=0
+            engine.reset()
+            for tr in trackers: tr.reset()
+
+            # Ações por modelo: "stop" só cala o áudio, outro texto é um comando fixo
+            if winner.action == "stop":
+                cooldown = time.time() + 2.0; continue
+            if winner.action and winner.action != "listen":
+                t = threading.Thread(target=route_and_respond, args=(winner.action, req_id))
+                t.daemon=True; t.start()
+                cooldown = time.time() + 2.0; continue
+
+            # A gravação começa já aqui (com pré-roll opcional); o "Sim?" fica mudo na gravação
+            cmd_ring = capture.subscribe(preroll_ms=preroll_ms, honor_mute=True)
             
             print("🎤 Fala...")
-            safe_play_tts("Sim?", speak=True)
+            capture.muted = True
+            try: safe_play_tts("Sim?", speak=True)
+            finally: capture.muted = False
             
-            audio_cmd = record_audio() 
+            # Com STT incremental, os troços de fala vão sendo transcritos durante a gravação
+            stt = start_streaming_transcription(req_id)
+            try: audio_cmd = record_audio(source=cmd_ring, on_segment=stt.feed if stt else None, preroll_ms=preroll_ms)
+            finally: capture.unsubscribe(cmd_ring)
+            wake_ring.clear()
             
-            t = threading.Thread(target=process_command_thread, args=(audio_cmd, req_id))
+            t = threading.Thread(target=process_command_thread, args=(audio_cmd, req_id, stt))
             t.daemon=True; t.start()
             cooldown = time.time() + 2.0
 
         except Exception as e:
             print(f"❌ Erro Main: {e}")
             traceback.print_exc()
+            if wake_ring is None: capture.stop()
             time.sleep(1)
 
 if __name__ == "__main__":
     setup_database(); load_skills()
     threading.Thread(target=lambda: app.run(host='0.0.0.0', port=5000), daemon=True).start()
-    try: whisper_model = whisper.load_model(getattr(config, 'WHISPER_MODEL', 'base')); ollama_client = ollama.Client()
+    try: stt_backend = load_stt_backend()
+    except: pass
+    try: command_recognizer = load_command_recognizer(SKILLS_LIST)
     except: pass
     for s in SKILLS_LIST: 
         if hasattr(s['module'], 'init_skill_daemon'): 
             try: s['module'].init_skill_daemon()
             except: pass
+    log_interval = getattr(config, 'SKILL_STATS_LOG_INTERVAL', 3600)
+    if log_interval: SKILL_METRICS.start_periodic_log(log_interval)
     try: main()
     except KeyboardInterrupt: stop_audio_output()
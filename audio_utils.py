@@ -10,6 +10,9 @@ import collections
 import config
 import hashlib 
 import traceback
+import threading
+import queue
+from stream_utils import AudioRingBuffer, StreamingResampler
 
 # Diretório para guardar os ficheiros de áudio gerados
 TTS_CACHE_DIR = "/opt/phantasma/cache/tts"
@@ -59,6 +62,72 @@ def play_tts(text, use_cache=True):
             p1.stdin.write(text_cleaned.encode('utf-8')); p1.stdin.close(); p3.wait()
         except: pass
 
+# --- TTS EM PIPELINE (Respostas em streaming) ---
+def _synthesize_wav(text, path):
+    """ piper + sox (mesmo efeito do play_tts) para um ficheiro WAV. """
+    p1 = subprocess.Popen(['piper', '--model', config.TTS_MODEL_PATH, '--output-raw'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    p2 = subprocess.Popen(['sox', '-t', 'raw', '-r', '22050', '-e', 'signed-integer', '-b', '16', '-c', '1', '-', path, 'flanger', '1', '1', '5', '50', '1', 'sin', 'tempo', '0.9'], stdin=p1.stdout)
+    p1.stdout.close()
+    p1.stdin.write(text.encode('utf-8')); p1.stdin.close(); p2.wait(); p1.wait()
+    return os.path.exists(path)
+
+class SpeechPipeline:
+    """
+    Fala uma resposta frase a frase enquanto o LLM ainda a está a gerar.
+    Duas threads: uma sintetiza (piper/sox) a frase seguinte enquanto a outra toca a atual (aplay),
+    por isso o tempo até ao primeiro som é o da primeira frase e não o da resposta inteira.
+    'is_active()' é consultado antes de cada frase (ex: o pedido foi interrompido pela hotword).
+    'on_playing(bool)' avisa quando o aplay começa e acaba cada frase (só aí o assistente está a falar).
+    """
+    def __init__(self, is_active=None, on_playing=None):
+        self.is_active = is_active or (lambda: True)
+        self.on_playing = on_playing or (lambda playing: None)
+        self.tmpdir = os.path.join(TTS_CACHE_DIR, "stream")
+        os.makedirs(self.tmpdir, exist_ok=True)
+        self.texts = queue.Queue()
+        self.wavs = queue.Queue(maxsize=2) # Sintetiza no máximo 2 frases à frente do que está a tocar
+        self.count = 0
+        self.first_audio_at = None
+        self.synth = threading.Thread(target=self._synth_loop, daemon=True)
+        self.player = threading.Thread(target=self._play_loop, daemon=True)
+        self.synth.start(); self.player.start()
+
+    def feed(self, sentence):
+        text = sentence.replace('**', '').replace('*', '').replace('#', '').replace('`', '').strip()
+        if text: self.texts.put(text)
+
+    def _synth_loop(self):
+        while True:
+            text = self.texts.get()
+            if text is None: break
+            if not self.is_active(): continue
+            path = os.path.join(self.tmpdir, f"{id(self)}_{self.count}.wav"); self.count += 1
+            try:
+                if _synthesize_wav(text, path): self.wavs.put((text, path))
+            except Exception as e: print(f"⚠️ TTS falhou: {e}")
+        self.wavs.put(None)
+
+    def _play_loop(self):
+        while True:
+            item = self.wavs.get()
+            if item is None: break
+            text, path = item
+            try:
+                if self.is_active():
+                    if self.first_audio_at is None: self.first_audio_at = time.time()
+                    print(f"IA: {text}")
+                    self.on_playing(True)
+                    try: subprocess.run(['aplay', '-D', config.ALSA_DEVICE_OUT, '-q', path], check=False)
+                    finally: self.on_playing(False)
+            finally:
+                try: os.remove(path)
+                except OSError: pass
+
+    def finish(self):
+        """ Fecha a entrada e espera que a última frase acabe de tocar. """
+        self.texts.put(None)
+        self.synth.join(); self.player.join()
+
 def play_random_music_snippet():
     try:
         mp3s = glob.glob(os.path.join('/home/media/music', '**/*.mp3'), recursive=True)
@@ -73,17 +142,121 @@ def play_random_song_full():
         return True
     except: return False
 
-def record_audio():
+# --- CAPTURA PARTILHADA ---
+class CaptureService:
+    """
+    Um único InputStream permanente no micro. O callback só escreve num ring buffer;
+    uma thread converte para 16 kHz e distribui pelos subscritores (hotword, gravação VAD).
+    Mantém um pré-roll para a gravação do comando não perder o início da fala.
+    """
+    def __init__(self, device=None, samplerate=16000, block=1280, preroll_ms=0):
+        self.device, self.samplerate, self.block = device, samplerate, block
+        self.read_size = -(-block * samplerate // 16000)
+        self.resampler = StreamingResampler(samplerate, 16000)
+        self.raw = AudioRingBuffer(self.read_size * 16, max_backlog=self.read_size * 8)
+        self.history = AudioRingBuffer(int(16000 * preroll_ms / 1000) + block * 2)
+        self.preroll = int(16000 * preroll_ms / 1000)
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.muted = False  # Durante o "Sim?" os subscritores que respeitam o mute recebem silêncio
+        self.stream = None
+        self.running = False
+
+    def _callback(self, indata, frames, time_info, status):
+        if status: print(f"⚠️ Audio Status: {status}")
+        self.raw.write(indata[:, 0])
+
+    def _open(self):
+        if self.stream:
+            try: self.stream.close()
+            except: pass
+        self.stream = sd.InputStream(device=self.device, channels=1, samplerate=self.samplerate,
+                                     dtype='int16', blocksize=self.read_size, callback=self._callback)
+        self.stream.start()
+        print(f"👂 Stream Ativo (device {self.device} @ {self.samplerate}Hz)")
+
+    def start(self):
+        self._open()
+        self.running = True
+        threading.Thread(target=self._pump, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        if self.stream:
+            try: self.stream.close()
+            except: pass
+
+    def _pump(self):
+        raw = np.zeros(self.read_size, dtype=np.int16)
+        out = np.zeros(self.block + 2, dtype=np.int16)
+        silence = np.zeros(self.block + 2, dtype=np.int16)
+        while self.running:
+            if self.raw.read_into(raw, timeout=2.0) is None:
+                # O device deixou de mandar áudio (USB desligado, xrun grave...): reabrir
+                print("⚠️ Captura sem dados. A reabrir o stream...")
+                try: self._open()
+                except Exception as e: print(f"❌ Erro ao reabrir captura: {e}"); time.sleep(1)
+                continue
+            chunk = raw if self.resampler.passthrough else self.resampler.process_int16(raw, out=out)
+            with self.lock:
+                self.history.write(chunk)
+                for ring, honor_mute in self.subscribers:
+                    ring.write(silence[:len(chunk)] if (honor_mute and self.muted) else chunk)
+
+    def subscribe(self, max_backlog_ms=None, preroll_ms=0, honor_mute=False):
+        """ Devolve um AudioRingBuffer a 16 kHz alimentado pela captura (opcionalmente com pré-roll). """
+        max_backlog = int(16000 * max_backlog_ms / 1000) if max_backlog_ms else 16000 * 30
+        ring = AudioRingBuffer(max_backlog + self.block * 4, max_backlog=max_backlog)
+        with self.lock:
+            if preroll_ms: ring.write(self.history.latest(min(self.preroll, int(16000 * preroll_ms / 1000))))
+            self.subscribers.append((ring, honor_mute))
+        return ring
+
+    def unsubscribe(self, ring):
+        with self.lock:
+            self.subscribers = [sub for sub in self.subscribers if sub[0] is not ring]
+
+def _device_frames(samples_per_frame, samplerate=None):
+    """ Gerador de frames a 16 kHz lidos de um stream próprio no device default. """
+    rate_in = samplerate or config.MIC_SAMPLERATE
+    resampler = StreamingResampler(rate_in, 16000)
+    samples_to_read = -(-samples_per_frame * rate_in // 16000)
+    pending = np.zeros(0, dtype=np.int16)
+    # Usa o DEFAULT do sistema (sem device=...)
+    with sd.InputStream(samplerate=rate_in, channels=1, dtype='int16') as stream:
+        while True:
+            raw_chunk, overflowed = stream.read(samples_to_read)
+            if overflowed: pass
+            # O resampler pode devolver +/- 1 amostra por bloco; acumulamos até ter um frame VAD
+            pending = np.concatenate([pending, resampler.process_int16(raw_chunk[:, 0])])
+            while len(pending) >= samples_per_frame:
+                yield pending[:samples_per_frame]
+                pending = pending[samples_per_frame:]
+
+def _ring_frames(source, samples_per_frame):
+    """ Gerador de frames a 16 kHz lidos de uma subscrição do CaptureService. """
+    frame = np.zeros(samples_per_frame, dtype=np.int16)
+    while True:
+        if source.read_into(frame, timeout=2.0) is None: return
+        yield frame
+
+def record_audio(source=None, samplerate=None, on_segment=None, preroll_ms=0):
     """ 
     A Lógica VAD Original (Afinada).
     Usa Vad(2) e espera 1.5s de silêncio.
-    Não aceita device_index (Usa Default do Sistema).
+    Sem 'source' abre o device default do sistema; com 'source' (subscrição do
+    CaptureService) reaproveita o stream da hotword, incluindo o pré-roll.
+    O áudio é sempre entregue a 16 kHz (VAD e Whisper), seja qual for o rate do micro.
+    Com 'on_segment(audio, final)' cada troço de fala é entregue numa pausa curta,
+    para o STT começar a trabalhar antes de o utilizador acabar.
+    'preroll_ms' é o pré-roll que a subscrição já traz: entra na gravação mas não conta
+    como fala (é o fim da hotword), senão o relógio do fim de fala arrancava antes do comando.
     """
     print("A ouvir...")
     
     vad = webrtcvad.Vad(2) 
     frame_duration_ms = 30 
-    samples_per_frame = int(config.MIC_SAMPLERATE * frame_duration_ms / 1000)
+    samples_per_frame = int(16000 * frame_duration_ms / 1000)
     
     silence_threshold_seconds = 1.5
     max_duration_seconds = 10.0
@@ -96,34 +269,52 @@ def record_audio():
     silence_limit_chunks = int(silence_threshold_seconds * chunks_per_second)
     max_chunks = int(max_duration_seconds * chunks_per_second)
 
+    # Segmentação para o STT incremental: corta numa pausa curta se o troço já for longo o suficiente
+    pause_chunks = max(1, getattr(config, 'STT_SEGMENT_PAUSE_MS', 300) // frame_duration_ms)
+    min_segment_chunks = int(getattr(config, 'STT_MIN_SEGMENT_S', 1.0) * chunks_per_second)
+    segment_start = 0
+    preroll_chunks = -(-preroll_ms // frame_duration_ms) if source is not None else 0
+
     try:
-        # Usa o DEFAULT do sistema (sem device=...)
-        with sd.InputStream(samplerate=config.MIC_SAMPLERATE, channels=1, dtype='int16') as stream:
-            for _ in range(max_chunks):
-                audio_chunk, overflowed = stream.read(samples_per_frame)
-                if overflowed: pass
-
-                audio_bytes = audio_chunk.tobytes()
-                is_speech = vad.is_speech(audio_bytes, config.MIC_SAMPLERATE)
-
-                if is_speech:
-                    silence_counter = 0
-                    speech_detected = True
-                else:
-                    silence_counter += 1
-
-                frames.append(audio_chunk.flatten().astype(np.float32) / 32768.0)
-
-                if speech_detected and silence_counter > silence_limit_chunks:
-                    print("Fim de fala detetado.")
-                    break
+        if source is not None: frame_iter = _ring_frames(source, samples_per_frame)
+        else: frame_iter = _device_frames(samples_per_frame, samplerate)
+
+        for n, audio_chunk in enumerate(frame_iter):
+            if n >= max_chunks: break
+
+            audio_bytes = audio_chunk.tobytes()
+            is_speech = vad.is_speech(audio_bytes, 16000)
+
+            if n < preroll_chunks: pass
+            elif is_speech:
+                silence_counter = 0
+                speech_detected = True
+            else:
+                silence_counter += 1
+
+            frames.append(audio_chunk.flatten().astype(np.float32) / 32768.0)
+
+            if on_segment and speech_detected and silence_counter == pause_chunks and len(frames) - segment_start >= min_segment_chunks:
+                on_segment(np.concatenate(frames[segment_start:]), False)
+                segment_start = len(frames)
+
+            if speech_detected and silence_counter > silence_limit_chunks:
+                print("Fim de fala detetado.")
+                break
+        frame_iter.close()
         
         print("Gravação terminada.")
         if not speech_detected:
+            if on_segment: on_segment(None, True)
             return np.array([], dtype='float32')
 
+        # O último troço só tem silêncio se a pausa final coincidiu com um corte
+        if on_segment:
+            tail = frames[segment_start:] if silence_counter < len(frames) - segment_start else []
+            on_segment(np.concatenate(tail) if tail else None, True)
         return np.concatenate(frames)
 
     except Exception as e:
         print(f"ERRO Gravação VAD: {e}")
+        if on_segment: on_segment(None, True)
         return np.array([], dtype='float32')
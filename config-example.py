@@ -28,21 +28,141 @@ WAKEWORD_PERSISTENCE = 1
 # 0.5 é o padrão. 0.6 ou 0.7 é recomendado para evitar falsos positivos da TV.
 WAKEWORD_CONFIDENCE = 0.6
 
+# Afinação por modelo (chave = nome do ficheiro sem .onnx). Os valores em falta usam os globais.
+# 'action': "listen" (grava comando), "stop" (só cala o áudio) ou um comando fixo (ex: "liga a luz da sala").
+WAKEWORD_PATIENCE = 2
+WAKEWORD_SETTINGS = {
+    "hey_fantasma": {"confidence": 0.6, "persistence": 1, "patience": 2, "action": "listen"},
+}
+
+# Pré-filtro de silêncio (RMS + webrtcvad): em silêncio não corre o openWakeWord (poupa CPU).
+# O pré-roll é injetado no modelo quando a porta abre, para não perder o início da hotword.
+WAKEWORD_GATE = True
+WAKEWORD_GATE_RMS = 100            # Energia mínima (int16) para considerar som
+WAKEWORD_GATE_HANGOVER_MS = 1000   # Tempo que a porta fica aberta depois do último som
+WAKEWORD_GATE_PREROLL_MS = 320
+
+# Atraso máximo (ms) de áudio acumulado antes de ser descartado.
+# Evita que a hotword fique segundos atrasada enquanto o Whisper/Ollama ocupam o CPU.
+WAKEWORD_MAX_BACKLOG_MS = 400
+
+# Áudio (ms) anterior à deteção que entra no início da gravação do comando.
+# A hotword e a gravação partilham o mesmo stream, por isso não há segundo open do micro.
+# Atenção: este áudio é o fim da própria hotword ("...tasma") e vai para o Whisper, o que
+# estraga as skills 'startswith' (memoriza..., diz...). Só vale a pena para quem não espera pelo "Sim?".
+COMMAND_PREROLL_MS = 0
+
 # --- Configs de Processamento (IA) ---
 OLLAMA_HOST_PRIMARY = "http://10.0.0.128:11434"  # Ex: Servidor com GPU dedicada
 OLLAMA_HOST_FALLBACK = "http://localhost:11434" # Fallback para processamento local
 OLLAMA_MODEL_PRIMARY = "llama3:8b"
 OLLAMA_MODEL_FALLBACK = "qwen3:8b"
 OLLAMA_TIMEOUT = 600
+LLM_CONNECT_TIMEOUT = 2.0    # Um host desligado falha logo, sem esperar o OLLAMA_TIMEOUT
+LLM_FAILURE_THRESHOLD = 1    # Falhas seguidas até o host ser posto de parte
+LLM_HOST_COOLDOWN = 60       # Segundos que um host em falha é saltado (sondado em fundo)
+LLM_PROBE_INTERVAL = 15      # Sondagem dos hosts em baixo (segundos)
+LLM_SLOW_FACTOR = 3.0        # O fallback passa à frente se o primário for X vezes mais lento (0 = ordem fixa)
+OLLAMA_KEEP_ALIVE = "30m"    # Modelo residente: o prefixo (SYSTEM_PROMPT) fica na KV cache entre perguntas
+# Orçamento de contexto: usa o menor num_ctx que cabe. Cada mudança de num_ctx recarrega o modelo,
+# por isso poucos tamanhos e o anterior é mantido durante LLM_CTX_STICKY_S se ainda couber.
+LLM_CTX_SIZES = [2048, 4096, 8192]
+LLM_CTX_STICKY_S = 300
+LLM_ANSWER_TOKENS = 600      # Reservados para a resposta
+LLM_CONTEXT_SHARES = {"skill": 2.0, "rag": 1.0, "web": 1.0}  # Divisão do espaço livre entre fontes
+LLM_MIN_SNIPPET_TOKENS = 40  # Abaixo disto não vale a pena meter um snippet cortado
+LLM_CHARS_PER_TOKEN = 3.2    # Estimativa inicial (calibrada com o prompt_eval_count de cada resposta)
+LLM_TOKENIZERS = {}          # Opcional: {"llama3:8b": "/caminho/tokenizer.json"} (pip install tokenizers)
+LLM_STREAMING = True         # Fala a resposta frase a frase enquanto o LLM ainda a gera
+TTS_STREAM_MIN_CHARS = 20    # Frases mais curtas juntam-se à seguinte (menos chamadas ao piper)
+TTS_STREAM_MAX_CHARS = 200   # Acima disto corta numa vírgula
 WHISPER_MODEL = "medium"
+# Motor STT: "whisper" (openai-whisper), "faster-whisper" (CTranslate2 int8, recomendado no CPU) ou "whisper.cpp"
+STT_ENGINE = "whisper"
+STT_MODEL = None           # None = usa o WHISPER_MODEL (no whisper.cpp, ex: "medium-q5_0")
+STT_COMPUTE_TYPE = "int8"  # faster-whisper: "int8", "int8_float32", "float32"
+STT_BEAM_SIZE = 1
+# Caminho rápido para comandos de domótica: Vosk com gramática fechada (triggers + nomes dos dispositivos).
+# Se a confiança for baixa (ou houver palavras fora da gramática) cai para o Whisper. None = desligado.
+STT_FAST_PATH_MODEL = None  # ex: "/opt/phantasma/models/vosk-model-small-pt-0.3"
+STT_FAST_PATH_CONFIDENCE = 0.85
+# STT incremental: transcreve troços de fala (cortados em pausas) enquanto ainda estás a falar.
+# Mais rápido, mas cada troço é descodificado sem o contexto da frase toda (pode errar mais). Opcional.
+STT_STREAMING = False
+STT_SEGMENT_PAUSE_MS = 300  # Pausa que fecha um troço
+STT_MIN_SEGMENT_S = 1.0     # Troços mais curtos juntam-se ao seguinte (o Whisper erra mais em áudio curto)
 RECORD_SECONDS = 7
 
 # --- Configs de Performance ---
 OLLAMA_THREADS = 4
 WHISPER_THREADS = 4
 
+# --- Routing de Skills ---
+# False = triggers casam como substring (comportamento clássico, ex: "+" na calculadora).
+# True = só casam em fronteira de palavra ("para" deixa de apanhar "parabéns").
+ROUTING_WORD_BOUNDARIES = False
+# "sequential" = tenta as skills uma a uma; "parallel" = corre as candidatas em simultâneo
+# e fica com a primeira (por prioridade) que responder. Só as skills com SPECULATIVE = True (só leitura)
+# arrancam logo; as que atuam em dispositivos ou chamam APIs pagas esperam pela vez.
+ROUTING_MODE = "sequential"
+ROUTING_WORKERS = 4
+ROUTING_SKILL_DEADLINE = 8.0  # Segundos por skill (ou SKILL_TIMEOUT no módulo da skill)
+SKILL_DEADLINES = {"skill_cloogy": 5.0, "skill_tapo": 25.0}
+ROUTING_TOTAL_DEADLINE = 30.0  # Teto para o routing todo, incluindo a espera na fila do pool
+SKILL_STATS_LOG_INTERVAL = 3600  # Resumo de latência/acertos das skills no log (segundos, 0 = desligado)
+
+# --- Base de Dados (memory.db) ---
+DB_POOL_SIZE = 4                # Ligações SQLite partilhadas pelas threads (modo WAL)
+DB_BUSY_TIMEOUT = 10            # Segundos à espera de um lock antes de desistir
+DB_WRITE_BATCH_INTERVAL = 0.5   # Escritas de cache agrupadas numa transação a cada X segundos
+
+# --- Cache de Respostas do LLM ---
+CACHE_TTL = 86400               # Validade de uma resposta em cache (segundos)
+CACHE_MEMORY_SIZE = 512         # Entradas na LRU em memória (à frente do SQLite)
+CACHE_CLEANUP_INTERVAL = 3600   # Limpeza de respostas expiradas (segundos, 0 = desligado)
+CACHE_VACUUM_FREE_RATIO = 0.25  # VACUUM quando as páginas livres passam esta fração da BD
+
+# --- Cache Semântica ---
+# Perguntas com outra formulação ("que horas são" vs "que horas são?") reaproveitam a resposta em cache
+SEMANTIC_CACHE = False  # Opt-in: cada pedido passa a fazer um embedding no Ollama (ollama pull do modelo abaixo)
+OLLAMA_EMBED_MODEL = "nomic-embed-text"  # ollama pull nomic-embed-text
+SEMANTIC_CACHE_THRESHOLD = 0.92  # Semelhança de cosseno mínima
+SEMANTIC_CACHE_TTL = 86400       # Segundos
+SEMANTIC_CACHE_MAX_ENTRIES = 2000  # Acima disto sai a entrada menos usada (LRU)
+SEMANTIC_CACHE_VOLATILE_WORDS = ["hoje", "agora", "amanhã", "ontem", "notícias", "tempo", "previsão"]
+SEMANTIC_CACHE_VOLATILE_TTL = 3600
+
+# --- RAG (Memórias) ---
+RAG_RECENCY_WEIGHT = 0.5          # Peso da recência face ao BM25 (0 = só relevância)
+RAG_RECENCY_HALF_LIFE_DAYS = 30   # Ao fim deste tempo o bónus de recência cai para metade
+RAG_CANDIDATES_FACTOR = 4         # Candidatos (BM25 e vetoriais) por resultado antes do re-ranking
+RAG_VECTORS = False               # Opt-in: embeddings das memórias (usa o OLLAMA_EMBED_MODEL)
+                                  # RAM: ~0,8 KB por memória com 768 dimensões (int8), ~77 MB para 100k
+RAG_HYBRID_ALPHA = 0.6            # Peso da semelhança vetorial face ao BM25
+RAG_VECTOR_MIN_SIM = 0.35         # Abaixo disto um vizinho vetorial é ignorado
+
+# --- Necessidade de Contexto (o que recolher antes do LLM) ---
+# Regras + naive Bayes decidem se o prompt precisa de memórias, de web, das duas ou de nenhuma
+RETRIEVAL_MODEL_PATH = os.path.join(BASE_DIR, "models/contexto_nb.json")  # Gerado por tools/treinar_contexto.py
+# Log dos prompts e decisões, para anotar e treinar. Guarda o que disseste em texto simples: desligado por omissão.
+RETRIEVAL_LOG_PATH = None         # ex: os.path.join(BASE_DIR, "contexto_log.jsonl")
+RETRIEVAL_LOG_MAX_BYTES = 1_000_000  # Acima disto o log roda para '.1' (só se guarda um anterior)
+RETRIEVAL_MODEL_MARGIN = 0.25     # O modelo só decide com P fora de [0.5 - margem, 0.5 + margem]; senão pede as duas
+
 # --- Configs de RAG (Web) ---
+# Cache e memórias são consultadas em paralelo, a web só se a cache falhar; o LLM arranca com o que chegou dentro do prazo
+RETRIEVAL_DEADLINES = {"cache": 1.5, "rag": 2.0, "web": 4.0}  # Segundos desde o início da recolha
 SEARXNG_URL = "http://127.0.0.1:8081" # A tua porta do SearxNG
+SEARXNG_TIMEOUT = 10.0
+SEARXNG_ENGINES = None            # Ex: ["duckduckgo", "wikipedia"] (None = os ativos no SearxNG)
+SEARXNG_CATEGORIES = None         # Ex: ["general", "news"]
+SEARXNG_TIME_RANGE = None         # "day", "week", "month", "year" ou None
+SEARXNG_LANGUAGE = "pt-PT"
+SEARXNG_CACHE_TTL = 3600          # Segundos que uma pesquisa fica em cache (0 = desliga)
+SEARXNG_CACHE_MAX_ENTRIES = 500
+SEARXNG_CACHE_PATH = os.path.join(BASE_DIR, "searxng_cache.json")  # None = só em memória
+SEARXNG_CACHE_SAVE_INTERVAL = 60  # Gravação do ficheiro em fundo (segundos), só quando há alterações
+SEARXNG_DEDUP_THRESHOLD = 0.6     # Snippets com semelhança (MinHash) acima disto contam como repetidos
 
 # --- Prompts de IA ---
 WHISPER_INITIAL_PROMPT = "Português de Portugal. Bumblebee. Como estás? Que horas são? Meteorologia. Quanto é? Toca música. Põe música. Memoriza isto. 1050 a dividir por 30."
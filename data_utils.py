@@ -1,39 +1,371 @@
 import sqlite3
+import threading
+import time
+import re
+import collections
+import contextlib
+import queue
+import numpy as np
 from datetime import datetime, timedelta
 import config
+from llm_utils import LLM
+
+# --- ACESSO À BD (Pool de ligações) ---
+class ConnectionPool:
+    """
+    Pool de ligações SQLite partilhado pelas threads (Flask, hotword, daemons do Dream).
+    Em modo WAL os leitores não bloqueiam o escritor, o que acaba com os "database is locked"
+    durante o sonho noturno. Cada ligação guarda as queries compiladas (cached_statements),
+    por isso reutilizar o mesmo SQL com parâmetros evita voltar a prepará-lo.
+    """
+    def __init__(self, path, size=4):
+        self.path = path
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=getattr(config, 'DB_BUSY_TIMEOUT', 10), check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL") # Seguro em WAL; só o último commit pode perder-se num corte de energia
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        """ Empresta uma ligação; commit no fim do bloco (rollback se houver exceção). """
+        try: conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                create = self.created < self.size
+                if create: self.created += 1
+            if create:
+                try: conn = self._connect()
+                except:
+                    with self.lock: self.created -= 1
+                    raise
+            else: conn = self.idle.get()
+        try:
+            yield conn
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+        finally: self.idle.put(conn)
+
+class WriteBatcher:
+    """ Escritas não urgentes (cache, estatísticas de uso) agrupadas numa só transação em fundo. """
+    def __init__(self, pool, interval=0.5, max_batch=500):
+        self.pool = pool
+        self.interval = interval
+        self.max_batch = max_batch
+        self.jobs = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, sql, params=()):
+        self.jobs.put((sql, params))
+
+    def flush(self):
+        """ Espera até as escritas pendentes estarem gravadas. """
+        self.jobs.join()
+
+    def _run(self):
+        while True:
+            batch = [self.jobs.get()]
+            deadline = time.time() + self.interval
+            while len(batch) < self.max_batch:
+                try: batch.append(self.jobs.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty: break
+            try:
+                with self.pool.connection() as conn:
+                    for sql, params in batch: conn.execute(sql, params)
+            except Exception as e: print(f"AVISO: Escrita em lote falhou ({len(batch)} operações): {e}")
+            finally:
+                for _ in batch: self.jobs.task_done()
+
+_pool = None
+_batcher = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool, _batcher
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(config.DB_PATH, getattr(config, 'DB_POOL_SIZE', 4))
+            _batcher = WriteBatcher(_pool, getattr(config, 'DB_WRITE_BATCH_INTERVAL', 0.5))
+        return _pool
+
+def db_connection():
+    """ Ligação do pool para usar com 'with' (skills incluídas, em vez de sqlite3.connect(config.DB_PATH)). """
+    return get_pool().connection()
+
+def db_write(sql, params=()):
+    """ Escrita assíncrona em lote (não devolve resultado nem lastrowid). """
+    get_pool()
+    _batcher.submit(sql, params)
+
+def db_flush():
+    if _batcher is not None: _batcher.flush()
 
 # --- SETUP ---
 def setup_database():
     """ Cria as tabelas 'memories' e 'cache' na BD se não existirem. """
     try:
-        conn = sqlite3.connect(config.DB_PATH)
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
         
-        # Tabela de Memórias (RAG)
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS memories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp DATETIME NOT NULL,
-            text TEXT NOT NULL
-        );
-        """)
+            # Tabela de Memórias (RAG)
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS memories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp DATETIME NOT NULL,
+                text TEXT NOT NULL
+            );
+            """)
         
-        # Tabela de Cache (Respostas Rápidas) - AS FUNÇÕES EM FALTA DEPENDEM DISTO
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS cache (
-            prompt TEXT PRIMARY KEY,
-            response TEXT NOT NULL,
-            timestamp DATETIME NOT NULL
-        );
-        """)
+            # Tabela de Cache (Respostas Rápidas) - AS FUNÇÕES EM FALTA DEPENDEM DISTO
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                prompt TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                timestamp DATETIME NOT NULL
+            );
+            """)
         
-        conn.commit()
-        conn.close()
+            # Embeddings dos prompts em cache (cache semântica). A resposta continua na tabela 'cache'.
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cache_vectors (
+                prompt TEXT PRIMARY KEY,
+                embedding BLOB NOT NULL,
+                expires REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            """)
+        
+            # Embeddings das memórias (float16) para o RAG vetorial; apagados com a memória
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS memory_vectors (
+                id INTEGER PRIMARY KEY,
+                embedding BLOB NOT NULL
+            );
+            """)
+            cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS memories_vd AFTER DELETE ON memories BEGIN
+                DELETE FROM memory_vectors WHERE id = old.id;
+            END;
+            """)
+            # Versão de memory_vectors (sobe a cada INSERT/DELETE): diz ao índice em memória se tem de recarregar
+            cursor.executescript("""
+            CREATE TABLE IF NOT EXISTS memory_vectors_version (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL);
+            INSERT OR IGNORE INTO memory_vectors_version (id, version) VALUES (0, 0);
+            CREATE TRIGGER IF NOT EXISTS memory_vectors_ai AFTER INSERT ON memory_vectors BEGIN
+                UPDATE memory_vectors_version SET version = version + 1 WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS memory_vectors_ad AFTER DELETE ON memory_vectors BEGIN
+                UPDATE memory_vectors_version SET version = version + 1 WHERE id = 0;
+            END;
+            """)
+        
+            conn.commit()
+            _setup_fts(conn)
         print(f"Base de dados e Cache inicializadas em '{config.DB_PATH}'.")
+        start_cache_janitor()
+        if getattr(config, 'RAG_VECTORS', False): threading.Thread(target=backfill_memory_vectors, daemon=True).start()
     except Exception as e:
         print(f"ERRO: Falha ao inicializar a base de dados SQLite: {e}")
 
+def _setup_fts(conn):
+    """
+    Índice FTS5 sobre 'memories' (external content), mantido por triggers. O tokenizer
+    unicode61 com remove_diacritics 2 dobra os acentos ('notícias' == 'noticias').
+    Na primeira vez (ou se o índice ficar dessincronizado) faz o backfill das linhas existentes.
+    """
+    global FTS_ENABLED
+    try:
+        conn.executescript("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+            text, content='memories', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER IF NOT EXISTS memories_ai AFTER INSERT ON memories BEGIN
+            INSERT INTO memories_fts(rowid, text) VALUES (new.id, new.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS memories_ad AFTER DELETE ON memories BEGIN
+            INSERT INTO memories_fts(memories_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        END;
+        CREATE TRIGGER IF NOT EXISTS memories_au AFTER UPDATE ON memories BEGIN
+            INSERT INTO memories_fts(memories_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            INSERT INTO memories_fts(rowid, text) VALUES (new.id, new.text);
+        END;
+        """)
+        total = conn.execute("SELECT COUNT(*) FROM memories").fetchone()[0]
+        indexed = conn.execute("SELECT COUNT(*) FROM memories_fts_docsize").fetchone()[0]
+        if total != indexed:
+            print(f"RAG: A indexar {total} memórias no FTS5...")
+            conn.execute("INSERT INTO memories_fts(memories_fts) VALUES ('rebuild')")
+        conn.commit()
+        FTS_ENABLED = True
+    except Exception as e:
+        FTS_ENABLED = False
+        print(f"AVISO: FTS5 indisponível ({e}). O RAG usa LIKE.")
+
 # --- RAG (MEMÓRIA DE LONGO PRAZO) ---
+FTS_ENABLED = False
+
+# Palavras sem conteúdo que só diluem o BM25
+RAG_STOPWORDS = {
+    "para", "como", "qual", "quais", "quem", "onde", "quando", "porque", "isto", "isso", "aquilo",
+    "este", "esta", "esse", "essa", "pelo", "pela", "pelos", "pelas", "mais", "menos", "muito",
+    "sobre", "entre", "tenho", "temos", "está", "estão", "foram", "sabes", "diz-me", "lembras",
+}
+
+def save_to_rag(text):
+    """ Grava uma memória (o trigger mantém o índice FTS5 atualizado) e o seu embedding. """
+    if not text or not text.strip(): return
+    try:
+        with db_connection() as conn:
+            mem_id = conn.execute("INSERT INTO memories (timestamp, text) VALUES (?, ?)", (str(datetime.now()), text.strip())).lastrowid
+        print("RAG: Memória gravada.")
+    except Exception as e:
+        print(f"ERRO: Falha ao gravar na BD RAG: {e}")
+        return
+    if getattr(config, 'RAG_VECTORS', False): MEMORY_VECTORS.add(mem_id, text.strip())
+
+# --- RAG VETORIAL ---
+def _quantize(vecs):
+    """ float32 (n, d) -> (int8 (n, d), escala por linha). Erro no cosseno ~1e-3 para vetores normalizados. """
+    scales = np.abs(vecs).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(vecs / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+class MemoryVectorIndex:
+    """
+    Embeddings das memórias guardados em float16 no SQLite (metade do espaço) e mantidos
+    em memória quantizados em int8 com uma escala por linha: ~77 MB para 100k memórias de
+    768 dimensões (em float32 seriam ~300 MB, demasiado para um Pi). Pesquisa exata por força
+    bruta, em blocos de VECTOR_BLOCK linhas convertidas para float32 (o numpy não tem BLAS para
+    int8/float16; a conversão int8 -> float32 é barata, a de float16 não): ~45 ms para 100k num CPU.
+    Cada INSERT/DELETE em memory_vectors sobe memory_vectors_version (triggers): se outra
+    ligação mexer na tabela (ex: a consolidação do Dream apaga memórias), a versão deixa de
+    bater e o índice recarrega da BD. Ler a versão é uma procura por chave primária (um
+    COUNT(*) percorria a tabela toda a cada pesquisa).
+    """
+    VECTOR_BLOCK = 4096
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = np.zeros(0, dtype=np.int64) # Com a mesma capacidade que a matriz
+        self.matrix = None # int8 (capacidade, d); só as primeiras self.size linhas são válidas
+        self.scales = None
+        self.size = 0
+        self.loaded = False
+        self.version = None # memory_vectors_version que a matriz reflete
+        self.dim = None # Dimensão do modelo de embeddings atual (a do último vetor calculado)
+
+    def _db_version(self, conn):
+        return conn.execute("SELECT version FROM memory_vectors_version WHERE id = 0").fetchone()[0]
+
+    def _load(self):
+        with db_connection() as conn:
+            version = self._db_version(conn) # Antes das linhas: uma escrita pelo meio só causa mais um reload
+            rows = conn.execute("SELECT id, embedding FROM memory_vectors ORDER BY id").fetchall()
+        size = self.dim * 2 if self.dim else (collections.Counter(len(r[1]) for r in rows).most_common(1) or [(0,)])[0][0]
+        if any(len(r[1]) != size for r in rows):
+            # Vetores de outro modelo: apagados (senão a versão nunca bate) e recalculados pelo backfill
+            with db_connection() as conn: conn.execute("DELETE FROM memory_vectors WHERE length(embedding) != ?", (size,))
+            print("RAG: Embeddings de outro modelo apagados, a recalcular...")
+            threading.Thread(target=backfill_memory_vectors, daemon=True).start()
+            return self._load()
+        self.version = version
+        self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.size = len(rows)
+        if not rows: self.matrix = self.scales = None
+        else:
+            d = size // 2
+            self.matrix = np.empty((len(rows), d), dtype=np.int8)
+            self.scales = np.empty(len(rows), dtype=np.float32)
+            # Por blocos, para o pico de memória não ser a matriz inteira em float32
+            for i in range(0, len(rows), self.VECTOR_BLOCK):
+                block = rows[i:i + self.VECTOR_BLOCK]
+                vecs = np.frombuffer(b"".join(r[1] for r in block), dtype=np.float16).reshape(len(block), d).astype(np.float32)
+                self.matrix[i:i + len(block)], self.scales[i:i + len(block)] = _quantize(vecs)
+        self.loaded = True
+
+    def _ensure_fresh(self):
+        if self.loaded:
+            with db_connection() as conn:
+                if self._db_version(conn) == self.version: return
+        self._load()
+
+    def _append(self, mem_id, vec):
+        if self.size == len(self.matrix): # Capacidade a dobrar: o backfill não copia a matriz a cada memória
+            self.matrix = np.concatenate([self.matrix, np.empty_like(self.matrix[:max(self.size, 16)])])
+            self.scales = np.concatenate([self.scales, np.empty(len(self.matrix) - len(self.scales), dtype=np.float32)])
+            self.ids = np.concatenate([self.ids, np.empty(len(self.matrix) - len(self.ids), dtype=np.int64)])
+        self.matrix[self.size:self.size + 1], self.scales[self.size:self.size + 1] = _quantize(vec[None, :])
+        self.ids[self.size] = mem_id
+        self.size += 1
+
+    def add(self, mem_id, text):
+        vec = embed_text(text)
+        if vec is None: return False
+        vec16 = vec.astype(np.float16)
+        try:
+            with db_connection() as conn:
+                conn.execute("INSERT OR REPLACE INTO memory_vectors (id, embedding) VALUES (?, ?)", (mem_id, vec16.tobytes()))
+                version = self._db_version(conn) # Na mesma transação: nenhuma outra escrita pelo meio
+        except Exception as e:
+            print(f"AVISO: Falha ao gravar embedding da memória {mem_id}: {e}")
+            return False
+        with self.lock:
+            self.dim = len(vec16)
+            # Só acrescenta se a nossa escrita foi a única desde o último load; senão recarrega
+            if (self.loaded and self.version == version - 1 and self.matrix is not None
+                    and self.matrix.shape[1] == len(vec16) and mem_id not in self.ids[:self.size]):
+                self._append(mem_id, vec16.astype(np.float32))
+                self.version = version
+            else: self.loaded = False
+        return True
+
+    def search(self, query_vec, k):
+        """ Devolve {id: semelhança} das k memórias mais próximas. """
+        with self.lock:
+            if self.dim != len(query_vec): self.dim, self.loaded = len(query_vec), False # Mudou o modelo de embeddings
+            self._ensure_fresh()
+            if self.matrix is None or not self.size or self.matrix.shape[1] != len(query_vec): return {}
+            sims = np.empty(self.size, dtype=np.float32)
+            buf = np.empty((min(self.VECTOR_BLOCK, self.size), self.matrix.shape[1]), dtype=np.float32)
+            for i in range(0, self.size, self.VECTOR_BLOCK):
+                n = min(self.VECTOR_BLOCK, self.size - i)
+                buf[:n] = self.matrix[i:i + n]
+                np.matmul(buf[:n], query_vec, out=sims[i:i + n])
+            sims *= self.scales[:self.size]
+            k = min(k, len(sims))
+            top = np.argpartition(-sims, k - 1)[:k]
+            return {int(self.ids[i]): float(sims[i]) for i in top}
+
+MEMORY_VECTORS = MemoryVectorIndex()
+
+_backfill_lock = threading.Lock()
+
+def backfill_memory_vectors():
+    """ Calcula os embeddings das memórias que ainda não os têm (memórias antigas, de outro modelo ou gravadas com o Ollama em baixo). """
+    if not _backfill_lock.acquire(blocking=False): return # Já há um backfill a correr
+    try:
+        try:
+            with db_connection() as conn:
+                rows = conn.execute("SELECT id, text FROM memories WHERE id NOT IN (SELECT id FROM memory_vectors)").fetchall()
+        except Exception as e:
+            print(f"AVISO: Backfill de embeddings falhou: {e}")
+            return
+        if not rows: return
+        print(f"RAG: A calcular embeddings de {len(rows)} memórias...")
+        done = 0
+        for mem_id, text in rows:
+            if not MEMORY_VECTORS.add(mem_id, text): break # Ollama indisponível: tenta no próximo arranque
+            done += 1
+        print(f"RAG: {done}/{len(rows)} memórias vetorizadas.")
+    finally: _backfill_lock.release()
+
 def save_fact_to_rag(text):
     """
     Tenta extrair apenas o facto antes de guardar. 
@@ -41,35 +373,98 @@ def save_fact_to_rag(text):
     """
     # Remove a persona da resposta antes de a tornar uma 'memória' permanente
     clean_text = re.sub(r'(Sombra|Silêncio|Fúria|Eco).*?[\.\!\?]', '', text, flags=re.IGNORECASE)
-    if len(clean_text.strip()) > 5:
-        # Lógica de insert original...
-        pass
+    if len(clean_text.strip()) > 5: save_to_rag(clean_text)
+
+def _rag_keywords(prompt):
+    # Filtro de palavras curtas e stopwords para evitar ruído
+    words = re.findall(r"[^\W_]+(?:-[^\W_]+)*", prompt.lower())
+    return [w for w in dict.fromkeys(words) if len(w) > 3 and w not in RAG_STOPWORDS]
+
+def _stem(word):
+    """ Stemming mínimo para o prefixo FTS: plurais e género ('luzes' -> 'luz', 'meses' -> 'mes', 'ligadas' -> 'ligad'). """
+    if len(word) > 4 and word.endswith(('zes', 'res', 'ses', 'les')): word = word[:-2]
+    elif len(word) > 4 and word.endswith('s'): word = word[:-1]
+    if len(word) > 5 and word[-1] in 'ao': word = word[:-1]
+    return word
+
+def _fts_candidates(keywords, n):
+    """ {id: (timestamp, texto, relevância BM25)} dos n melhores pelo FTS5. """
+    # Cada termo entre aspas (sem sintaxe FTS injetada) e com prefixo: 'luz' apanha 'luzes'
+    match = " OR ".join('"' + _stem(w).replace('"', '') + '"*' for w in keywords)
+    with db_connection() as conn:
+        rows = conn.execute(
+            "SELECT m.id, m.timestamp, m.text, bm25(memories_fts) FROM memories_fts "
+            "JOIN memories m ON m.id = memories_fts.rowid WHERE memories_fts MATCH ? "
+            "ORDER BY bm25(memories_fts) LIMIT ?", (match, n)
+        ).fetchall()
+    # bm25() do SQLite é negativo (mais negativo = mais relevante)
+    return {r[0]: (r[1], r[2], -r[3]) for r in rows}
+
+def _hybrid_search(prompt, keywords, limit):
+    """
+    Junta os candidatos do BM25 e do índice vetorial. Cada lado é normalizado para [0, 1]
+    e misturado com RAG_HYBRID_ALPHA (peso do vetorial), depois multiplicado pelo bónus de recência.
+    Devolve [(timestamp, texto)].
+    """
+    n = limit * getattr(config, 'RAG_CANDIDATES_FACTOR', 4)
+    keyword_hits = _fts_candidates(keywords, n) if (FTS_ENABLED and keywords) else {}
+    vector_hits = {}
+    if getattr(config, 'RAG_VECTORS', False):
+        qvec = embed_text(_normalize_prompt(prompt))
+        if qvec is not None:
+            min_sim = getattr(config, 'RAG_VECTOR_MIN_SIM', 0.35)
+            vector_hits = {i: sim for i, sim in MEMORY_VECTORS.search(qvec, n).items() if sim >= min_sim}
+
+    missing = [i for i in vector_hits if i not in keyword_hits]
+    rows = {i: (ts, text) for i, (ts, text, _) in keyword_hits.items()}
+    if missing:
+        with db_connection() as conn:
+            q = f"SELECT id, timestamp, text FROM memories WHERE id IN ({','.join('?' * len(missing))})"
+            for i, ts, text in conn.execute(q, missing).fetchall(): rows[i] = (ts, text)
+
+    max_bm25 = max((v[2] for v in keyword_hits.values()), default=0) or 1.0
+    alpha = getattr(config, 'RAG_HYBRID_ALPHA', 0.6) if vector_hits else 0.0
+    half_life = getattr(config, 'RAG_RECENCY_HALF_LIFE_DAYS', 30) * 86400
+    weight = getattr(config, 'RAG_RECENCY_WEIGHT', 0.5)
+    now = time.time()
+    scored = []
+    for i, (ts, text) in rows.items():
+        kw = keyword_hits[i][2] / max_bm25 if i in keyword_hits else 0.0
+        relevance = alpha * vector_hits.get(i, 0.0) + (1 - alpha) * kw
+        try: age = max(0.0, now - _parse_ts(ts))
+        except: age = half_life
+        scored.append((relevance * (1 + weight * 0.5 ** (age / half_life)), ts, text))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [(ts, text) for _, ts, text in scored[:limit]]
+
+def _like_search(keywords, limit):
+    """ Caminho antigo (sem FTS5): LIKE por palavra, ordenado por data. """
+    query_parts = " OR ".join(["text LIKE ?"] * len(keywords))
+    with db_connection() as conn:
+        return conn.execute(
+            f"SELECT timestamp, text FROM memories WHERE {query_parts} ORDER BY timestamp DESC LIMIT ?",
+            [f"%{w}%" for w in keywords] + [limit]
+        ).fetchall()
 
 def retrieve_from_rag(prompt, max_results=5):
     """
     Recupera memórias relevantes com TIMESTAMPS para dar contexto temporal.
     """
     try:
-        # Filtro de palavras curtas para evitar ruído
-        keywords = [word for word in prompt.lower().split() if len(word) > 3]
-        if not keywords:
+        keywords = _rag_keywords(prompt)
+        use_vectors = getattr(config, 'RAG_VECTORS', False)
+        if not keywords and not use_vectors:
             return "" 
 
-        conn = sqlite3.connect(config.DB_PATH)
-        cursor = conn.cursor()
-        
-        query_parts = []
-        params = []
-        for word in keywords:
-            query_parts.append("text LIKE ?")
-            params.append(f"%{word}%")
-            
-        # Selecionamos também o timestamp
-        sql_query = f"SELECT timestamp, text FROM memories WHERE {' OR '.join(query_parts)} ORDER BY timestamp DESC LIMIT {max_results}"
-        
-        cursor.execute(sql_query, params)
-        results = cursor.fetchall()
-        conn.close()
+        if FTS_ENABLED: results = _hybrid_search(prompt, keywords, max_results)
+        else:
+            # Sem FTS5: LIKE por palavra, completado com os vizinhos vetoriais (se houver)
+            results = _like_search(keywords, max_results) if keywords else []
+            if use_vectors and len(results) < max_results:
+                seen = {r[1] for r in results}
+                results += [r for r in _hybrid_search(prompt, [], max_results) if r[1] not in seen][:max_results - len(results)]
+        # Escolhidas por relevância, apresentadas por data (o LLM dá prioridade à mais recente)
+        results.sort(key=lambda r: str(r[0]), reverse=True)
 
         if results:
             context_str = "MEMÓRIAS PESSOAIS DO UTILIZADOR (Ordenadas da mais recente para a antiga):\n"
@@ -94,44 +489,305 @@ def retrieve_from_rag(prompt, max_results=5):
         return ""
 
 # --- CACHE (RESPOSTAS RÁPIDAS) - AS FUNÇÕES QUE FALTAVAM ---
+def _cache_ttl():
+    return getattr(config, 'CACHE_TTL', 86400)
+
+def _parse_ts(ts):
+    if isinstance(ts, datetime): return ts.timestamp()
+    return datetime.fromisoformat(ts).timestamp()
+
+class ResponseLRU:
+    """ LRU em memória (tamanho e TTL limitados) à frente da tabela 'cache'. """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict() # prompt -> (resposta, expira_em)
+        self.counters = collections.Counter()
+
+    def get(self, prompt):
+        with self.lock:
+            item = self.entries.get(prompt)
+            if item is None: return None
+            if item[1] < time.time():
+                del self.entries[prompt]
+                return None
+            self.entries.move_to_end(prompt)
+            return item[0]
+
+    def put(self, prompt, response, expires):
+        with self.lock:
+            self.entries[prompt] = (response, expires)
+            self.entries.move_to_end(prompt)
+            while len(self.entries) > getattr(config, 'CACHE_MEMORY_SIZE', 512): self.entries.popitem(last=False)
+
+    def discard(self, prompt):
+        with self.lock: self.entries.pop(prompt, None)
+
+    def count(self, event):
+        with self.lock: self.counters[event] += 1
+
+RESPONSE_LRU = ResponseLRU()
 
 def get_cached_response(prompt):
-    """ Tenta recuperar uma resposta exata da cache (válida por 24h). """
-    try:
-        conn = sqlite3.connect(config.DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT response, timestamp FROM cache WHERE prompt = ?", (prompt,))
-        row = cursor.fetchone()
-        conn.close()
+    """ Tenta recuperar uma resposta da cache: memória, depois SQLite (exata, válida por CACHE_TTL), depois semântica. """
+    if not prompt: return None
+    hit = RESPONSE_LRU.get(prompt)
+    if hit:
+        RESPONSE_LRU.count("memory_hits")
+        print("CACHE: Resposta recuperada da memória.")
+        return hit
+    exact = _get_exact_cached_response(prompt)
+    if exact:
+        RESPONSE_LRU.count("disk_hits")
+        return exact
+    semantic = SEMANTIC_CACHE.lookup(prompt)
+    RESPONSE_LRU.count("semantic_hits" if semantic else "misses")
+    return semantic
 
+def _get_exact_cached_response(prompt):
+    try:
+        with db_connection() as conn:
+            row = conn.execute("SELECT response, timestamp FROM cache WHERE prompt = ?", (prompt,)).fetchone()
         if row:
             response, timestamp_str = row
-            # Verifica validade (ex: 24 horas)
-            try:
-                cached_time = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S.%f")
-                if datetime.now() - cached_time < timedelta(hours=24):
-                    print("CACHE: Resposta recuperada da base de dados.")
-                    return response
-            except:
-                # Se falhar a data, usa na mesma
-                return response
+            # Verifica validade (CACHE_TTL, 24h por omissão)
+            try: expires = _parse_ts(timestamp_str) + _cache_ttl()
+            except: expires = time.time() + _cache_ttl() # Se falhar a data, usa na mesma
+            if expires < time.time(): return None
+            RESPONSE_LRU.put(prompt, response, expires)
+            print("CACHE: Resposta recuperada da base de dados.")
+            return response
         return None
     except Exception as e:
         print(f"AVISO: Erro ao ler cache: {e}")
         return None
 
-def save_cached_response(prompt, response):
-    """ Guarda uma resposta na cache para uso futuro. """
+def save_cached_response(prompt, response, ttl=None):
+    """ Guarda uma resposta na cache para uso futuro ('ttl' em segundos para a entrada semântica). """
     if not prompt or not response: return
+    now = datetime.now()
+    RESPONSE_LRU.put(prompt, response, now.timestamp() + _cache_ttl())
     try:
-        conn = sqlite3.connect(config.DB_PATH)
-        cursor = conn.cursor()
-        # INSERT OR REPLACE atualiza se a chave (prompt) já existir
-        cursor.execute(
-            "INSERT OR REPLACE INTO cache (prompt, response, timestamp) VALUES (?, ?, ?)",
-            (prompt, response, datetime.now())
-        )
-        conn.commit()
-        conn.close()
+        # INSERT OR REPLACE atualiza se a chave (prompt) já existir; vai no próximo lote (a LRU já a serve)
+        db_write("INSERT OR REPLACE INTO cache (prompt, response, timestamp) VALUES (?, ?, ?)", (prompt, response, str(now)))
     except Exception as e:
         print(f"AVISO: Erro ao gravar cache: {e}")
+    # O embedding é um pedido ao Ollama: em fundo, para a resposta não ficar à espera dele
+    if SEMANTIC_CACHE.enabled: threading.Thread(target=SEMANTIC_CACHE.add, args=(prompt,), kwargs={"ttl": ttl}, daemon=True).start()
+
+def cache_stats():
+    """ Contadores de hits/misses por camada e tamanho atual da LRU. """
+    with RESPONSE_LRU.lock:
+        stats = {k: RESPONSE_LRU.counters.get(k, 0) for k in ["memory_hits", "disk_hits", "semantic_hits", "misses", "expired_rows"]}
+        stats["memory_entries"] = len(RESPONSE_LRU.entries)
+    total = sum(stats[k] for k in ["memory_hits", "disk_hits", "semantic_hits", "misses"])
+    stats["hit_rate"] = round((total - stats["misses"]) / total, 3) if total else None
+    stats["semantic_entries"] = len(SEMANTIC_CACHE.prompts)
+    return stats
+
+def purge_expired_cache():
+    """ Apaga as linhas expiradas de 'cache' e 'cache_vectors' e compacta a BD se houver muitas páginas livres. """
+    cutoff = str(datetime.now() - timedelta(seconds=_cache_ttl()))
+    try:
+        db_flush() # Escritas pendentes primeiro, para não apagar vetores de respostas ainda na fila
+        with db_connection() as conn:
+            # Os timestamps são ISO ('AAAA-MM-DD HH:MM:SS.ffffff'), por isso a comparação de texto respeita a ordem
+            deleted = conn.execute("DELETE FROM cache WHERE timestamp < ?", (cutoff,)).rowcount
+            conn.execute("DELETE FROM cache_vectors WHERE expires < ? OR prompt NOT IN (SELECT prompt FROM cache)", (time.time(),))
+            conn.commit()
+            free, pages = conn.execute("PRAGMA freelist_count").fetchone()[0], conn.execute("PRAGMA page_count").fetchone()[0]
+            if pages and free / pages > getattr(config, 'CACHE_VACUUM_FREE_RATIO', 0.25):
+                conn.execute("VACUUM")
+                print(f"CACHE: BD compactada ({free}/{pages} páginas livres).")
+        if deleted:
+            with RESPONSE_LRU.lock: RESPONSE_LRU.counters["expired_rows"] += deleted
+            SEMANTIC_CACHE.invalidate()
+            print(f"CACHE: {deleted} respostas expiradas removidas.")
+        return deleted
+    except Exception as e:
+        print(f"AVISO: Erro na limpeza da cache: {e}")
+        return 0
+
+_janitor_started = False
+
+def start_cache_janitor():
+    """ Thread de fundo que chama purge_expired_cache a cada CACHE_CLEANUP_INTERVAL segundos. """
+    global _janitor_started
+    interval = getattr(config, 'CACHE_CLEANUP_INTERVAL', 3600)
+    if _janitor_started or not interval: return
+    _janitor_started = True
+    def loop():
+        while True:
+            purge_expired_cache()
+            time.sleep(interval)
+    threading.Thread(target=loop, daemon=True).start()
+
+# --- EMBEDDINGS (Ollama) ---
+_recent_embeddings = collections.OrderedDict() # O mesmo prompt é embebido pela cache semântica e pelo RAG
+_embeds_in_flight = {} # texto -> Event do pedido em curso (a cache e o RAG correm em paralelo)
+_embed_lock = threading.Lock()
+
+def embed_text(text):
+    """
+    Vetor normalizado (float32) do texto, calculado pelo OLLAMA_EMBED_MODEL. None se nenhum host responder.
+    Um só pedido ao Ollama por texto: quem chega enquanto outro o está a calcular espera pelo mesmo resultado.
+    """
+    if not text or not text.strip(): return None
+    with _embed_lock:
+        if text in _recent_embeddings:
+            _recent_embeddings.move_to_end(text)
+            return _recent_embeddings[text]
+        pending = _embeds_in_flight.get(text)
+        if pending is None: _embeds_in_flight[text] = threading.Event()
+    if pending is not None:
+        pending.wait()
+        with _embed_lock: return _recent_embeddings.get(text)
+    vec = None
+    try:
+        raw = LLM.embed(text, getattr(config, 'OLLAMA_EMBED_MODEL', 'nomic-embed-text'))
+        if raw is None: return None
+        vec = np.asarray(raw, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if not norm: vec = None; return None
+        vec /= norm
+        return vec
+    finally:
+        with _embed_lock:
+            if vec is not None:
+                _recent_embeddings[text] = vec
+                if len(_recent_embeddings) > 32: _recent_embeddings.popitem(last=False)
+            _embeds_in_flight.pop(text).set()
+
+def _normalize_prompt(prompt):
+    """ Minúsculas e sem pontuação: 'Que horas são?' e 'que horas são' dão o mesmo embedding. """
+    return re.sub(r"[^\w\s]", "", prompt.lower()).strip()
+
+# --- CACHE SEMÂNTICA ---
+
+class SemanticCache:
+    """
+    Procura respostas em cache por semelhança (cosseno) entre embeddings dos prompts,
+    para apanhar as variações de frase/Whisper que falham a chave exata da tabela 'cache'.
+    Os vetores ficam numa matriz em memória (um produto matricial por pesquisa) e em
+    'cache_vectors' no SQLite. Cada entrada tem TTL próprio; acima de max_entries sai
+    a menos usada recentemente (LRU).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.prompts = []
+        self.matrix = None
+        self.expires = []
+        self.last_used = []
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return getattr(config, 'SEMANTIC_CACHE', False)
+
+    def _load(self):
+        if self.loaded: return
+        self.loaded = True
+        try:
+            with db_connection() as conn:
+                conn.execute("DELETE FROM cache_vectors WHERE expires < ?", (time.time(),))
+                rows = conn.execute("SELECT prompt, embedding, expires, last_used FROM cache_vectors").fetchall()
+        except Exception as e:
+            print(f"AVISO: Erro ao carregar cache semântica: {e}")
+            return
+        if not rows: return
+        self.prompts = [r[0] for r in rows]
+        self.matrix = np.stack([np.frombuffer(r[1], dtype=np.float32) for r in rows])
+        self.expires = [r[2] for r in rows]
+        self.last_used = [r[3] for r in rows]
+        print(f"CACHE: {len(rows)} entradas semânticas carregadas.")
+
+    def _embed(self, prompt):
+        return embed_text(_normalize_prompt(prompt))
+
+    def _remove(self, idx, conn, drop_response=True):
+        conn.execute("DELETE FROM cache_vectors WHERE prompt = ?", (self.prompts[idx],))
+        if drop_response:
+            conn.execute("DELETE FROM cache WHERE prompt = ?", (self.prompts[idx],))
+            RESPONSE_LRU.discard(self.prompts[idx])
+        del self.prompts[idx], self.expires[idx], self.last_used[idx]
+        self.matrix = np.delete(self.matrix, idx, axis=0) if self.prompts else None
+
+    def _ttl_for(self, prompt):
+        """ Perguntas que dependem do momento ('hoje', 'agora'...) expiram mais cedo. """
+        p_low = prompt.lower()
+        if any(w in p_low for w in getattr(config, 'SEMANTIC_CACHE_VOLATILE_WORDS', [])):
+            return getattr(config, 'SEMANTIC_CACHE_VOLATILE_TTL', 3600)
+        return getattr(config, 'SEMANTIC_CACHE_TTL', 86400)
+
+    def lookup(self, prompt):
+        """ Resposta do prompt em cache mais parecido, se a semelhança passar SEMANTIC_CACHE_THRESHOLD. """
+        if not self.enabled or not prompt: return None
+        with self.lock:
+            self._load()
+            if self.matrix is None: return None
+        # O embedding é um pedido ao Ollama: fora do lock, para um host lento não bloquear as outras pesquisas
+        vec = self._embed(prompt)
+        if vec is None: return None
+        with self.lock:
+            if self.matrix is None or vec.shape[0] != self.matrix.shape[1]: return None
+            sims = self.matrix @ vec
+            idx = int(np.argmax(sims))
+            now = time.time()
+            if sims[idx] < getattr(config, 'SEMANTIC_CACHE_THRESHOLD', 0.92) or self.expires[idx] < now:
+                self.misses += 1
+                return None
+            cached_prompt = self.prompts[idx]
+            self.last_used[idx] = now
+        try:
+            db_write("UPDATE cache_vectors SET last_used = ? WHERE prompt = ?", (now, cached_prompt))
+            hit = RESPONSE_LRU.get(cached_prompt)
+            if hit: row = (hit,)
+            else:
+                with db_connection() as conn:
+                    row = conn.execute("SELECT response FROM cache WHERE prompt = ?", (cached_prompt,)).fetchone()
+        except Exception as e:
+            print(f"AVISO: Erro ao ler cache semântica: {e}")
+            return None
+        if not row: return None
+        self.hits += 1
+        print(f"CACHE: Resposta semântica ('{cached_prompt}', semelhança {sims[idx]:.3f}).")
+        return row[0]
+
+    def add(self, prompt, ttl=None):
+        """ Indexa o prompt (a resposta já foi gravada na tabela 'cache'). """
+        if not self.enabled or not prompt: return
+        vec = self._embed(prompt) # Fora do lock (ver lookup)
+        if vec is None: return
+        with self.lock:
+            self._load()
+            now = time.time()
+            expires = now + (ttl if ttl is not None else self._ttl_for(prompt))
+            with db_connection() as conn:
+                try:
+                    if prompt in self.prompts: self._remove(self.prompts.index(prompt), conn, drop_response=False)
+                    if self.matrix is not None and self.matrix.shape[1] != vec.shape[0]:
+                        # Mudou o modelo de embeddings: os vetores antigos deixam de ser comparáveis
+                        conn.execute("DELETE FROM cache_vectors")
+                        self.prompts, self.expires, self.last_used, self.matrix = [], [], [], None
+                    conn.execute("INSERT OR REPLACE INTO cache_vectors (prompt, embedding, expires, last_used) VALUES (?, ?, ?, ?)",
+                                 (prompt, vec.tobytes(), expires, now))
+                    self.prompts.append(prompt); self.expires.append(expires); self.last_used.append(now)
+                    self.matrix = vec[None, :] if self.matrix is None else np.vstack([self.matrix, vec])
+
+                    # Expirados primeiro, depois LRU até caber no limite
+                    for idx in [i for i, e in enumerate(self.expires) if e < now][::-1]: self._remove(idx, conn)
+                    max_entries = getattr(config, 'SEMANTIC_CACHE_MAX_ENTRIES', 2000)
+                    while len(self.prompts) > max_entries:
+                        self._remove(int(np.argmin(self.last_used)), conn)
+                    conn.commit()
+                except Exception as e:
+                    print(f"AVISO: Erro ao gravar cache semântica: {e}")
+
+    def invalidate(self):
+        """ Obriga a recarregar os vetores da BD (ex: depois da limpeza de expirados). """
+        with self.lock:
+            self.loaded = False
+            self.prompts, self.expires, self.last_used, self.matrix = [], [], [], None
+
+SEMANTIC_CACHE = SemanticCache()
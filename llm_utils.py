@@ -0,0 +1,394 @@
+import re
+import time
+import threading
+import config
+
+try: import httpx
+except ImportError: httpx = None
+
+# --- ESTADO DE CADA HOST ---
+class HostState:
+    """ Cliente persistente (pool HTTP keep-alive do httpx) e saúde de um host Ollama. """
+    def __init__(self, host, model):
+        self.host = host
+        self.model = model
+        self.client = None
+        self.failures = 0
+        self.open_until = 0.0 # Circuit breaker: enquanto time.time() < open_until o host é saltado
+        self.latency = None   # Média móvel (EWMA) do tempo por pedido, em segundos
+        self.lock = threading.Lock()
+
+    @property
+    def healthy(self):
+        return time.time() >= self.open_until
+
+    def record_success(self, elapsed=None):
+        with self.lock:
+            self.failures = 0
+            self.open_until = 0.0
+            if elapsed is not None: self.latency = elapsed if self.latency is None else 0.7 * self.latency + 0.3 * elapsed
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= getattr(config, 'LLM_FAILURE_THRESHOLD', 1):
+                self.open_until = time.time() + getattr(config, 'LLM_HOST_COOLDOWN', 60)
+
+    def snapshot(self):
+        return {"host": self.host, "model": self.model, "healthy": self.healthy, "failures": self.failures,
+                "retry_in_s": round(max(0.0, self.open_until - time.time()), 1),
+                "latency_s": round(self.latency, 2) if self.latency is not None else None}
+
+def _is_unreachable(error):
+    """ Só erros de rede/timeout abrem o breaker (um modelo em falta no host não o torna 'em baixo'). """
+    if isinstance(error, (ConnectionError, TimeoutError)): return True
+    return httpx is not None and isinstance(error, httpx.TransportError)
+
+# --- GESTOR DE CLIENTES ---
+class OllamaManager:
+    """
+    Clientes Ollama partilhados por todo o Phantasma (assistant, skill_memory, skill_dream).
+    - Um ollama.Client por host, criado uma vez (a ligação TCP fica viva entre pedidos).
+    - Timeout de ligação curto: um host desligado falha em LLM_CONNECT_TIMEOUT, não em OLLAMA_TIMEOUT.
+    - Circuit breaker: depois de LLM_FAILURE_THRESHOLD falhas o host é saltado durante
+      LLM_HOST_COOLDOWN segundos; uma thread sonda-o e devolve-o assim que responder.
+    - Ordem por latência: o fallback só passa à frente se o primário estiver LLM_SLOW_FACTOR vezes mais lento.
+    """
+    def __init__(self, targets=None):
+        if targets is None:
+            targets = [
+                (getattr(config, 'OLLAMA_HOST_PRIMARY', None), getattr(config, 'OLLAMA_MODEL_PRIMARY', 'llama3')),
+                (getattr(config, 'OLLAMA_HOST_FALLBACK', 'http://localhost:11434'), getattr(config, 'OLLAMA_MODEL_FALLBACK', 'llama3'))
+            ]
+        self.hosts = [HostState(h, m) for h, m in targets if h]
+        self.probe_started = False
+        self.lock = threading.Lock()
+
+    def _client(self, state):
+        if state.client is None:
+            import ollama
+            timeout = getattr(config, 'OLLAMA_TIMEOUT', 600)
+            if httpx is not None: timeout = httpx.Timeout(timeout, connect=getattr(config, 'LLM_CONNECT_TIMEOUT', 2.0))
+            state.client = ollama.Client(host=state.host, timeout=timeout)
+        return state.client
+
+    def targets(self):
+        """ Hosts saudáveis pela ordem a tentar; se estiverem todos em baixo, tenta-os todos na mesma. """
+        healthy = [s for s in self.hosts if s.healthy]
+        if not healthy: return list(self.hosts)
+        slow = getattr(config, 'LLM_SLOW_FACTOR', 3.0)
+        if slow and len(healthy) > 1 and all(s.latency is not None for s in healthy[:2]):
+            first, second = healthy[0], healthy[1]
+            if first.latency > slow * second.latency: healthy[0], healthy[1] = second, first
+        return healthy
+
+    def _start_probe(self):
+        with self.lock:
+            if self.probe_started: return
+            self.probe_started = True
+        threading.Thread(target=self._probe_loop, daemon=True).start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(getattr(config, 'LLM_PROBE_INTERVAL', 15))
+            for state in self.hosts:
+                if state.healthy: continue
+                try:
+                    if httpx is not None: httpx.get(f"{state.host.rstrip('/')}/api/version", timeout=2.0).raise_for_status()
+                    else: self._client(state).list()
+                    state.record_success()
+                    print(f"✅ Ollama {state.host} voltou a responder.")
+                except Exception: pass
+
+    def _call(self, fn, label, track_latency=True):
+        """ Corre fn(client, model) no primeiro host que responder. Devolve (resultado, estado do host). """
+        last_error = None
+        for state in self.targets():
+            t0 = time.time()
+            try:
+                if label: print(f"🤖 {label}: {state.host} (Modelo: {state.model})")
+                result = fn(self._client(state), state.model)
+                state.record_success(time.time() - t0 if track_latency else None)
+                return result, state
+            except Exception as e:
+                if _is_unreachable(e): state.record_failure()
+                last_error = e
+                print(f"⚠️ Falha no host {state.host} ({label or 'embedding'}): {e}. A tentar fallback...")
+                if not state.healthy: self._start_probe()
+        if last_error is not None: print(f"❌ Nenhum host Ollama respondeu: {last_error}")
+        return None, None
+
+    def _defaults(self, kwargs):
+        # Mantém o modelo carregado entre perguntas (senão a KV cache do prefixo perde-se ao fim de 5 min)
+        keep_alive = getattr(config, 'OLLAMA_KEEP_ALIVE', None)
+        if keep_alive is not None: kwargs.setdefault('keep_alive', keep_alive)
+        return kwargs
+
+    def chat(self, messages, options=None, **kwargs):
+        """ client.chat com failover. Devolve o texto da resposta (ou None). """
+        kwargs = self._defaults(kwargs)
+        resp, state = self._call(lambda c, model: c.chat(model=model, messages=messages, options=options, **kwargs), "Ollama")
+        if not resp: return None
+        TOKENS.calibrate(state.model, messages, resp)
+        return resp['message']['content']
+
+    def chat_stream(self, messages, options=None, **kwargs):
+        """
+        Versão em streaming do chat: gerador com os pedaços de texto à medida que chegam.
+        O failover só acontece antes do primeiro token (a meio de uma resposta já não há troca de host):
+        se o stream cair depois disso a exceção sobe, para o chamador não tomar a resposta cortada por inteira.
+        """
+        kwargs = self._defaults(kwargs)
+        def start(c, model):
+            stream = c.chat(model=model, messages=messages, options=options, stream=True, **kwargs)
+            return stream, next(stream, None) # Força a ligação e o primeiro token dentro do failover
+        t0 = time.time()
+        res, state = self._call(start, "Ollama (stream)", track_latency=False)
+        if not res: return
+        stream, first = res
+        last = first
+        if first is not None: yield first['message']['content']
+        try:
+            for part in stream:
+                last = part
+                yield part['message']['content']
+            state.record_success(time.time() - t0)
+            if last is not None: TOKENS.calibrate(state.model, messages, last) # O último pedaço traz as contagens
+        except Exception as e:
+            print(f"⚠️ Stream interrompido ({state.host}): {e}")
+            if _is_unreachable(e):
+                state.record_failure()
+                if not state.healthy: self._start_probe()
+            raise
+
+    def embed(self, text, model):
+        """ Vetor de embedding (lista de floats) com failover, ou None. """
+        def fn(c, m):
+            # API nova (embed) com fallback para a antiga (embeddings)
+            try: return c.embed(model=model, input=text)['embeddings'][0]
+            except AttributeError: return c.embeddings(model=model, prompt=text)['embedding']
+        vec, _ = self._call(fn, None, track_latency=False)
+        return vec
+
+    def expected_model(self):
+        """ Modelo do host que vai ser tentado primeiro (para contar tokens antes do pedido). """
+        targets = self.targets()
+        return targets[0].model if targets else None
+
+    def status(self):
+        return [s.snapshot() for s in self.hosts]
+
+# --- CONTAGEM DE TOKENS ---
+class TokenCounter:
+    """
+    Conta tokens para o modelo de destino. O Ollama não expõe o tokenizer, por isso:
+    - se LLM_TOKENIZERS tiver um tokenizer.json (HuggingFace 'tokenizers') para o modelo, usa-o;
+    - senão estima com caracteres/token, calibrado por modelo com o prompt_eval_count de cada resposta.
+    """
+    MESSAGE_OVERHEAD = 8 # Tokens do chat template por mensagem (cabeçalhos de role, separadores)
+
+    def __init__(self):
+        self.ratios = {}     # modelo -> caracteres por token (EWMA)
+        self.tokenizers = {} # modelo -> Tokenizer (ou None se não houver)
+        self.lock = threading.Lock()
+
+    def _tokenizer(self, model):
+        if model not in self.tokenizers:
+            path = (getattr(config, 'LLM_TOKENIZERS', {}) or {}).get(model)
+            tok = None
+            if path:
+                try:
+                    from tokenizers import Tokenizer
+                    tok = Tokenizer.from_file(path)
+                except Exception as e: print(f"⚠️ Tokenizer de {model} indisponível: {e}")
+            self.tokenizers[model] = tok
+        return self.tokenizers[model]
+
+    def count(self, text, model=None):
+        if not text: return 0
+        tok = self._tokenizer(model) if model else None
+        if tok is not None: return len(tok.encode(text).ids)
+        ratio = self.ratios.get(model, getattr(config, 'LLM_CHARS_PER_TOKEN', 3.2))
+        return int(len(text) / ratio) + 1
+
+    def count_messages(self, messages, model=None):
+        return sum(self.count(m['content'], model) + self.MESSAGE_OVERHEAD for m in messages)
+
+    COLD_LOAD_NS = 300_000_000 # load_duration acima disto = modelo (re)carregado, sem KV cache
+
+    def calibrate(self, model, messages, resp):
+        """
+        Ajusta o rácio com o prompt_eval_count real, só em avaliações a frio (modelo acabado de
+        carregar). Com o modelo residente o prefixo de sistema vem da KV cache e o prompt_eval_count
+        só conta o sufixo: calibrar com isso subestimava os tokens e escolhia um num_ctx curto demais.
+        """
+        def field(name):
+            try: return resp.get(name) or 0
+            except AttributeError: return getattr(resp, name, 0) or 0
+        evaluated = field('prompt_eval_count')
+        if not model or not evaluated or self._tokenizer(model) is not None: return
+        if field('load_duration') < self.COLD_LOAD_NS: return
+        chars = sum(len(m['content']) for m in messages)
+        tokens = evaluated - self.MESSAGE_OVERHEAD * len(messages)
+        if tokens <= 0: return
+        ratio = chars / tokens
+        if not 1.5 <= ratio <= 6.0: return # Medida absurda (resposta truncada, template diferente...)
+        with self.lock:
+            old = self.ratios.get(model)
+            self.ratios[model] = ratio if old is None else 0.8 * old + 0.2 * ratio
+
+TOKENS = TokenCounter()
+
+LLM = OllamaManager()
+
+# --- PROMPT ---
+# Instruções fixas: ficam no fim da mensagem de sistema para o prefixo ser sempre igual
+LLM_RESPONSE_INSTRUCTIONS = (
+    "### INSTRUÇÃO DE RESPOSTA:\n"
+    "Responde de forma fluida e melancólica. NÃO uses cabeçalhos como '**Sombra**' ou '**Fim**'. "
+    "NÃO digas que a pergunta é irrelevante. Sê um assistente, não um juiz.\n"
+    "Usa o CONHECIMENTO DISPONÍVEL da mensagem do utilizador apenas para factos."
+)
+
+def build_llm_messages(prompt, rag, web, skill_context):
+    """
+    Mensagem de sistema estável (persona + instruções, igual em todos os pedidos) e uma
+    mensagem de utilizador com a parte variável (RAG, web, skills, pergunta). Com o modelo
+    residente (keep_alive), o Ollama reaproveita a KV cache do prefixo comum e só avalia o sufixo.
+    """
+    sys_prompt = getattr(config, 'SYSTEM_PROMPT', '')
+    user = (
+        "### CONHECIMENTO DISPONÍVEL (Usa apenas para factos):\n"
+        f"{rag}\n{web}\n{skill_context}\n\n"
+        f"Utilizador: {prompt}"
+    )
+    return [{'role': 'system', 'content': f"{sys_prompt}\n\n{LLM_RESPONSE_INSTRUCTIONS}"}, {'role': 'user', 'content': user}]
+
+def _split_items(section):
+    """ Separa um bloco de contexto em (cabeçalho, [itens '- ...']) para poder cortar item a item. """
+    header, items = [], []
+    for line in (section or "").splitlines():
+        if line.startswith("- "): items.append(line)
+        elif items and line.strip(): items[-1] += "\n" + line # Continuação do item anterior
+        elif line.strip(): header.append(line)
+    return "\n".join(header), items
+
+def _truncate(text, max_tokens, model):
+    """ Corta o texto numa fronteira de palavra para caber em max_tokens. """
+    if TOKENS.count(text, model) <= max_tokens: return text
+    lo, hi = 0, len(text)
+    while lo < hi: # Pesquisa binária pelo maior prefixo que cabe
+        mid = (lo + hi + 1) // 2
+        if TOKENS.count(text[:mid] + "…", model) <= max_tokens: lo = mid
+        else: hi = mid - 1
+    cut = text[:lo].rsplit(" ", 1)[0] if " " in text[:lo] else text[:lo]
+    return cut + "…"
+
+def _fit_section(section, budget, model):
+    """ Mantém os itens pela ordem (já vêm por relevância) até esgotar o orçamento; o último pode ser cortado. """
+    if not section or budget <= 0: return "", 0
+    header, items = _split_items(section)
+    if not items: # Bloco sem itens (ex: facto de uma skill): corta o texto inteiro
+        text = _truncate(section.strip(), budget, model)
+        return text, TOKENS.count(text, model)
+    out = [header] if header else []
+    used = TOKENS.count(header, model)
+    for item in items:
+        cost = TOKENS.count(item, model) + 1
+        if used + cost <= budget:
+            out.append(item); used += cost
+            continue
+        if budget - used >= getattr(config, 'LLM_MIN_SNIPPET_TOKENS', 40):
+            item = _truncate(item, budget - used - 1, model)
+            out.append(item); used += TOKENS.count(item, model) + 1
+        break
+    if len(out) == (1 if header else 0): return "", 0 # Só sobrou o cabeçalho
+    return "\n".join(out) + "\n", used
+
+def _allocate(needs, shares, available):
+    """ Divide 'available' pelas secções segundo 'shares'; o que uma secção não precisa passa às outras. """
+    alloc = {k: 0 for k in needs}
+    pending = {k for k in needs if needs[k] > 0}
+    while pending and available > 0:
+        total = sum(shares.get(k, 1.0) for k in pending)
+        grant = {k: int(available * shares.get(k, 1.0) / total) for k in pending}
+        done = {k for k in pending if needs[k] - alloc[k] <= grant[k]}
+        if not done: # Ninguém fica satisfeito: distribui o resto e acaba
+            for k in pending: alloc[k] += grant[k]
+            break
+        for k in done:
+            available -= needs[k] - alloc[k]
+            alloc[k] = needs[k]
+        pending -= done
+    return alloc
+
+_ctx_state = {} # modelo -> (num_ctx, timestamp): evita recarregar o modelo a cada pergunta
+
+def _pick_num_ctx(model, needed):
+    """ Menor num_ctx de LLM_CTX_SIZES que cabe; mantém o anterior por LLM_CTX_STICKY_S se ainda couber. """
+    sizes = sorted(getattr(config, 'LLM_CTX_SIZES', [2048, 4096, 8192]))
+    num_ctx = next((n for n in sizes if n >= needed), sizes[-1])
+    last = _ctx_state.get(model)
+    # Mudar o num_ctx obriga o Ollama a recarregar o modelo (e perde a KV cache do prefixo)
+    if last and last[0] >= needed and time.time() - last[1] < getattr(config, 'LLM_CTX_STICKY_S', 300): num_ctx = last[0]
+    _ctx_state[model] = (num_ctx, time.time())
+    return num_ctx
+
+def build_llm_prompt(prompt, rag, web, skill_context):
+    """
+    Monta as mensagens dentro de um orçamento de tokens: sistema e pergunta entram sempre,
+    LLM_ANSWER_TOKENS ficam reservados para a resposta e o resto de LLM_CTX_SIZES[-1] é dividido
+    entre factos das skills, memórias e web (LLM_CONTEXT_SHARES), cortando os snippets menos relevantes.
+    Devolve (messages, num_ctx).
+    """
+    model = LLM.expected_model()
+    max_ctx = max(getattr(config, 'LLM_CTX_SIZES', [2048, 4096, 8192]))
+    reserve = getattr(config, 'LLM_ANSWER_TOKENS', 600)
+    fixed = TOKENS.count_messages(build_llm_messages(prompt, "", "", ""), model)
+    sections = {"skill": skill_context or "", "rag": rag or "", "web": web or ""}
+    needs = {k: TOKENS.count(v, model) for k, v in sections.items()}
+    shares = getattr(config, 'LLM_CONTEXT_SHARES', {"skill": 2.0, "rag": 1.0, "web": 1.0})
+    budget = _allocate(needs, shares, max_ctx - reserve - fixed)
+    fitted = {k: _fit_section(v, budget[k], model)[0] if needs[k] > budget[k] else v for k, v in sections.items()}
+
+    messages = build_llm_messages(prompt, fitted["rag"], fitted["web"], fitted["skill"])
+    used = TOKENS.count_messages(messages, model)
+    num_ctx = _pick_num_ctx(model, used + reserve)
+    trimmed = [k for k in sections if fitted[k] != sections[k]]
+    print(f"🧮 Prompt: ~{used} tokens | num_ctx {num_ctx}" + (f" | cortado: {', '.join(trimmed)}" if trimmed else ""))
+    return messages, num_ctx
+
+# --- FRASES PARA O TTS ---
+class SentenceChunker:
+    """
+    Junta os tokens do LLM e devolve frases completas para o TTS. Corta em '.', '!', '?', '…'
+    ou mudança de linha seguidos de espaço (não parte '3.5' nem 'www.site.pt'); abaixo de
+    min_chars espera pela frase seguinte e acima de max_chars aceita cortar numa vírgula.
+    """
+    BOUNDARY = re.compile(r'[.!?…]+["»)]?\s+|\n+')
+    SOFT_BOUNDARY = re.compile(r'[,;:]\s+')
+
+    def __init__(self, min_chars=None, max_chars=None):
+        self.min_chars = min_chars if min_chars is not None else getattr(config, 'TTS_STREAM_MIN_CHARS', 20)
+        self.max_chars = max_chars if max_chars is not None else getattr(config, 'TTS_STREAM_MAX_CHARS', 200)
+        self.buffer = ""
+
+    def feed(self, token):
+        """ Devolve a lista de frases prontas depois de acrescentar o token. """
+        self.buffer += token or ""
+        out = []
+        while True:
+            cut = None
+            for m in self.BOUNDARY.finditer(self.buffer):
+                if m.end() >= self.min_chars: cut = m.end(); break
+            if cut is None and len(self.buffer) > self.max_chars:
+                soft = [m.end() for m in self.SOFT_BOUNDARY.finditer(self.buffer) if m.end() >= self.min_chars]
+                cut = soft[-1] if soft else None
+            if cut is None: return out
+            sentence, self.buffer = self.buffer[:cut].strip(), self.buffer[cut:]
+            if sentence: out.append(sentence)
+
+    def flush(self):
+        """ O resto do texto (fim do stream). """
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
@@ -0,0 +1,217 @@
+import re
+import os
+import json
+import math
+import time
+import threading
+import collections
+import config
+
+# Palavras que indicam intenção de desligar/parar (dão prioridade às skills que as têm nos triggers)
+OFF_KEYWORDS = ['desliga', 'para', 'apaga', 'fecha', 'recolhe', 'stop', 'cancelar']
+
+class TriggerIndex:
+    """
+    Índice de routing compilado uma vez no load_skills: um autómato Aho-Corasick com os
+    TRIGGERS de todas as skills e as OFF_KEYWORDS. Um único varrimento do prompt dá as
+    skills candidatas já pela ordem de prioridade, em vez de O(skills x triggers) por pedido.
+    Por omissão mantém a semântica antiga (substring); com word_boundaries=True só aceita
+    triggers que começam e acabam em fronteira de palavra.
+    """
+    def __init__(self, skills, off_keywords=OFF_KEYWORDS, word_boundaries=False):
+        self.skills = list(skills)
+        self.word_boundaries = word_boundaries
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        self.patterns = [] # (comprimento, skill_idx ou None para OFF_KEYWORD, startswith)
+        self.always = set() # Skills com trigger vazio ("" in prompt é sempre True)
+
+        for idx, s in enumerate(self.skills):
+            startswith = s.get('trigger_type') == 'startswith'
+            for t in s.get('triggers', []):
+                t = str(t).lower()
+                if not t: self.always.add(idx); continue
+                self._add(t, idx, startswith)
+        for k in off_keywords: self._add(k.lower(), None, False)
+        self._build()
+
+        # Prioridade pré-calculada: com intenção OFF, skills cujos triggers contêm uma OFF_KEYWORD vêm primeiro
+        def off_priority(s):
+            trigs = [str(tr).lower() for tr in s.get('triggers', [])]
+            return 1 if any(k in tr for tr in trigs for k in off_keywords) else 0
+        base = list(range(len(self.skills)))
+        self.order_default = base
+        self.order_off = sorted(base, key=lambda i: off_priority(self.skills[i]), reverse=True)
+
+    def _add(self, pattern, skill_idx, startswith):
+        state = 0
+        for ch in pattern:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({}); self.fail.append(0); self.out.append([])
+            state = nxt
+        self.out[state].append(len(self.patterns))
+        self.patterns.append((len(pattern), skill_idx, startswith))
+
+    def _build(self):
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]: f = self.fail[f]
+                fallback = self.goto[f].get(ch, 0)
+                self.fail[nxt] = fallback if fallback != nxt else 0 # Nós de profundidade 1 apontam para a raiz
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def _at_boundary(self, text, start, end):
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        return not before.isalnum() and not after.isalnum()
+
+    def scan(self, p_low):
+        """ Devolve (skills que casaram, intenção OFF) num só varrimento do prompt. """
+        matched, off_intent = set(self.always), False
+        state = 0
+        for pos, ch in enumerate(p_low):
+            while state and ch not in self.goto[state]: state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for pid in self.out[state]:
+                length, skill_idx, startswith = self.patterns[pid]
+                start = pos - length + 1
+                if skill_idx is None: off_intent = True; continue
+                if startswith and start != 0: continue
+                if self.word_boundaries and not self._at_boundary(p_low, start, pos + 1): continue
+                matched.add(skill_idx)
+        return matched, off_intent
+
+    def candidates(self, p_low):
+        """ Skills com triggers no prompt, pela ordem em que o router as deve tentar. """
+        matched, off_intent = self.scan(p_low)
+        order = self.order_off if off_intent else self.order_default
+        return [self.skills[i] for i in order if i in matched]
+
+# --- NECESSIDADE DE CONTEXTO (RAG / Web) ---
+# Regras rápidas: conversa sem factos externos, referências à vida do utilizador e perguntas sobre a atualidade
+CHITCHAT_PATTERNS = [r"^(ol[aá]|bom dia|boa tarde|boa noite|obrigad[oa]|adeus|at[eé] logo)\b", r"\bcomo est[aá]s\b",
+                     r"\bquem [eé]s\b", r"\bo que (achas|pensas)\b", r"\b(gostas|sentes)\b", r"\bconta(-me)? uma (piada|hist[oó]ria)\b",
+                     r"\b(tudo bem|est[aá]s a[ií])\b"]
+MEMORY_PATTERNS = [r"\blembras(-te)?\b", r"\b(te|eu) (disse|contei)\b", r"\b(o|a|os|as) (meu|minha|meus|minhas)\b",
+                   r"\bmemoriz", r"\bquando (é que )?eu\b", r"\bsabes (o|a) (meu|minha)\b"]
+WEB_PATTERNS = [r"\bnot[ií]cias?\b", r"\bhoje\b", r"\b[uú]ltim[oa]s?\b", r"\bresultados?\b", r"\bpre[cç]o\b", r"\bquanto custa\b",
+                r"\bquem ganhou\b", r"\bprevis[aã]o\b", r"\batual(mente)?\b", r"\b20\d\d\b", r"\bpesquisa\b", r"\bprocura\b",
+                r"\besta semana\b", r"\beste (ano|m[eê]s)\b", r"\baconteceu\b"]
+
+def _features(prompt):
+    """ Palavras e bigramas (minúsculas, sem pontuação) para o naive Bayes. """
+    words = re.findall(r"[^\W\d_]+", prompt.lower())
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+class NaiveBayes:
+    """ Naive Bayes multinomial binário (suavização de Laplace). Treinado pelo tools/treinar_contexto.py. """
+    def __init__(self, data=None):
+        data = data or {}
+        self.docs = data.get("docs", [0, 0])           # Nº de prompts [negativos, positivos]
+        self.counts = data.get("counts", [{}, {}])     # Contagem de cada feature por classe
+        self.totals = [sum(c.values()) for c in self.counts]
+        self.vocab = set(self.counts[0]) | set(self.counts[1])
+
+    def fit(self, samples):
+        """ samples: [(prompt, bool)] """
+        self.docs, self.counts = [0, 0], [collections.Counter(), collections.Counter()]
+        for prompt, label in samples:
+            self.docs[int(label)] += 1
+            self.counts[int(label)].update(_features(prompt))
+        self.counts = [dict(c) for c in self.counts]
+        self.totals = [sum(c.values()) for c in self.counts]
+        self.vocab = set(self.counts[0]) | set(self.counts[1])
+        return self
+
+    def prob(self, prompt):
+        """ P(positivo | prompt), ou None se o modelo não tiver exemplos das duas classes. """
+        if not all(self.docs): return None
+        v = len(self.vocab) or 1
+        logp = [math.log(self.docs[c] / sum(self.docs)) for c in (0, 1)]
+        for f in _features(prompt):
+            if f not in self.vocab: continue
+            for c in (0, 1): logp[c] += math.log((self.counts[c].get(f, 0) + 1) / (self.totals[c] + v))
+        m = max(logp)
+        e = [math.exp(x - m) for x in logp]
+        return e[1] / (e[0] + e[1])
+
+    def to_dict(self):
+        return {"docs": self.docs, "counts": self.counts}
+
+class RetrievalClassifier:
+    """
+    Decide antes da recolha se o prompt precisa de memórias (RAG), de web, das duas ou de nenhuma.
+    1. Regras (conversa / memória pessoal / atualidade) quando são claras.
+    2. Senão, o naive Bayes treinado com os nossos prompts (RETRIEVAL_MODEL_PATH), se estiver confiante.
+    3. Na dúvida, pede as duas (o comportamento antigo): perder contexto custa mais que uma pesquisa a mais.
+    Cada decisão fica em RETRIEVAL_LOG_PATH para ser anotada e voltar a treinar o modelo.
+    """
+    def __init__(self, model_path=None):
+        self.chitchat = [re.compile(p) for p in CHITCHAT_PATTERNS]
+        self.memory = [re.compile(p) for p in MEMORY_PATTERNS]
+        self.web = [re.compile(p) for p in WEB_PATTERNS]
+        self.models = {}
+        self.stats = collections.Counter()
+        self.lock = threading.Lock()
+        model_path = model_path or getattr(config, 'RETRIEVAL_MODEL_PATH', None)
+        if model_path and os.path.exists(model_path):
+            try:
+                with open(model_path, encoding="utf-8") as f: data = json.load(f)
+                self.models = {k: NaiveBayes(data[k]) for k in ("memory", "web") if k in data}
+                print(f"🧭 Classificador de contexto: {sum(data.get('memory', {}).get('docs', [0]))} prompts de treino")
+            except Exception as e: print(f"⚠️ Modelo de contexto inválido ({model_path}): {e}")
+
+    def _model_says(self, kind, prompt):
+        model = self.models.get(kind)
+        p = model.prob(prompt) if model else None
+        if p is None: return None
+        margin = getattr(config, 'RETRIEVAL_MODEL_MARGIN', 0.25) # Só confia fora de [0.5 - margem, 0.5 + margem]
+        if p >= 0.5 + margin: return True
+        if p <= 0.5 - margin: return False
+        return None
+
+    def decide(self, prompt):
+        """ Devolve {"memory": bool, "web": bool, "source": {...}}. """
+        p_low = prompt.lower().strip()
+        decision, source = {}, {}
+        chitchat = any(r.search(p_low) for r in self.chitchat)
+        hits = {"memory": any(r.search(p_low) for r in self.memory), "web": any(r.search(p_low) for r in self.web)}
+        for kind in ("memory", "web"):
+            if hits[kind]: decision[kind], source[kind] = True, "rules"
+            # Conversa não precisa de nada; sobre a vida do utilizador a web não sabe responder
+            elif chitchat or (kind == "web" and hits["memory"]): decision[kind], source[kind] = False, "rules"
+            else:
+                verdict = self._model_says(kind, p_low)
+                if verdict is not None: decision[kind], source[kind] = verdict, "model"
+                else: decision[kind], source[kind] = True, "default"
+        with self.lock:
+            for kind in ("memory", "web"): self.stats[f"{kind}_{'on' if decision[kind] else 'off'}_{source[kind]}"] += 1
+        return {**decision, "source": source}
+
+    def log(self, prompt, decision, **signals):
+        """
+        Acrescenta o prompt ao log de treino (JSONL). 'signals' ex: rag_hits, web_hits.
+        Só com RETRIEVAL_LOG_PATH definido (guarda o que o utilizador disse em texto simples);
+        acima de RETRIEVAL_LOG_MAX_BYTES o ficheiro passa a '.1' (substitui o anterior).
+        """
+        path = getattr(config, 'RETRIEVAL_LOG_PATH', None)
+        if not path: return
+        entry = {"ts": time.strftime("%Y-%m-%d %H:%M:%S"), "prompt": prompt,
+                 "decision": {"memory": decision["memory"], "web": decision["web"]}, "source": decision["source"], **signals}
+        try:
+            with self.lock:
+                max_bytes = getattr(config, 'RETRIEVAL_LOG_MAX_BYTES', 1_000_000)
+                if max_bytes and os.path.exists(path) and os.path.getsize(path) >= max_bytes: os.replace(path, f"{path}.1")
+                with open(path, "a", encoding="utf-8") as f: f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except Exception as e: print(f"⚠️ Falha ao gravar log de contexto: {e}")
+
+    def snapshot(self):
+        with self.lock: return dict(self.stats)
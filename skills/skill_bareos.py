@@ -4,6 +4,8 @@ import config
 
 # --- Configuração da Skill ---
 TRIGGER_TYPE = "contains"
+# Corre o comando do Bareos e envia email: não é especulativa
+SPECULATIVE = False
 # Triggers simples, a lógica de intenção está no 'handle'
 TRIGGERS = ["backups", "bareos"]
 
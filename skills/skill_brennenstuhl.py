@@ -5,6 +5,8 @@ import config
 
 # --- Configuração da Skill ---
 TRIGGER_TYPE = "contains"
+# Consulta o estado do detetor; não atua
+SPECULATIVE = True
 TRIGGERS = [
     "alarme de incêndio", 
     "detetor de fumo", 
@@ -4,6 +4,8 @@ import re
 
 # --- Configuração da Skill ---
 TRIGGER_TYPE = "contains"
+# Cálculo local sem efeitos secundários: pode arrancar em paralelo
+SPECULATIVE = True
 
 # Gatilhos expandidos para apanhar operações no meio da frase
 TRIGGERS = [
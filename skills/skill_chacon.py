@@ -19,6 +19,8 @@ except ImportError as e:
 
 # --- Configuração da Skill ---
 TRIGGER_TYPE = "contains"
+# Atua na luz do balcão (sem execução especulativa)
+SPECULATIVE = False
 
 # Palavras-chave de Ação
 ACTIONS_ON = ["liga", "ligar", "acende", "acender", "ativa", "põe"]
@@ -4,18 +4,17 @@ import threading
 import time
 import datetime
 import random
-import sqlite3
 import json
 import re
-import os
 import ast  # Essencial para lidar com aspas simples do LLM
-import ollama
-import config
 from tools import search_with_searxng
-from data_utils import save_to_rag
+from data_utils import save_to_rag, db_connection
+from llm_utils import LLM
 
 # --- Configuração ---
 TRIGGER_TYPE = "contains"
+# Arranca o processo onírico (escreve no RAG): não é especulativa
+SPECULATIVE = False
 TRIGGERS = ["vai sonhar", "aprende algo", "desenvolve a persona", "sonho lúcido", "notícias", "novidades"]
 
 DREAM_TIME = "02:30" 
@@ -24,27 +23,12 @@ LUCID_DREAM_CHANCE = 0.3
 # --- Helper de Inferência com Failover ---
 
 def _safe_ollama_chat(prompt, system_instruction=""):
-    """ Tenta o host primário e depois o fallback, tal como no assistant.py """
-    targets = [
-        (getattr(config, 'OLLAMA_HOST_PRIMARY', None), getattr(config, 'OLLAMA_MODEL_PRIMARY', 'llama3')),
-        (getattr(config, 'OLLAMA_HOST_FALLBACK', 'http://localhost:11434'), getattr(config, 'OLLAMA_MODEL_FALLBACK', 'llama3'))
-    ]
-    
-    for host, model in targets:
-        if not host: continue
-        try:
-            client = ollama.Client(host=host, timeout=config.OLLAMA_TIMEOUT)
-            messages = []
-            if system_instruction:
-                messages.append({'role': 'system', 'content': system_instruction})
-            messages.append({'role': 'user', 'content': prompt})
-            
-            resp = client.chat(model=model, messages=messages)
-            return resp['message']['content']
-        except Exception as e:
-            print(f"⚠️ [Dream] Falha no host {host}: {e}")
-            continue
-    return None
+    """ Primário e depois fallback, com os clientes partilhados do llm_utils (tal como no assistant.py) """
+    messages = []
+    if system_instruction:
+        messages.append({'role': 'system', 'content': system_instruction})
+    messages.append({'role': 'user', 'content': prompt})
+    return LLM.chat(messages)
 
 # --- Utils de Extração Robusta ---
 
@@ -75,10 +59,8 @@ def _consolidate_memories():
     """ Funde memórias recentes, mantendo factos e purgando a persona repetitiva. """
     print("🧠 [Dream] A consolidar histórico...")
     try:
-        conn = sqlite3.connect(config.DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, timestamp, text FROM memories ORDER BY id DESC LIMIT 15")
-        rows = cursor.fetchall()
+        with db_connection() as conn:
+            rows = conn.execute("SELECT id, timestamp, text FROM memories ORDER BY id DESC LIMIT 15").fetchall()
         if len(rows) < 5: return
 
         ids_to_purge = [r[0] for r in rows]
@@ -96,12 +78,12 @@ def _consolidate_memories():
         merged = _extract_json(ans)
         
         if merged and isinstance(merged, dict):
-            cursor.execute(f"DELETE FROM memories WHERE id IN ({','.join(['?']*len(ids_to_purge))})", ids_to_purge)
+            # Grava a fusão antes de apagar os originais (se falhar a meio, nada se perde)
             save_to_rag(json.dumps(merged, ensure_ascii=False))
-            conn.commit()
+            with db_connection() as conn:
+                conn.execute(f"DELETE FROM memories WHERE id IN ({','.join(['?']*len(ids_to_purge))})", ids_to_purge)
             print("🧠 [Dream] Consolidação terminada.")
     except Exception as e: print(f"❌ Erro Consolidação: {e}")
-    finally: conn.close()
 
 def _perform_news_dream():
     """ Mantém o pHantasma atualizado com notícias locais e de nicho. """
@@ -127,11 +109,8 @@ def _perform_web_dream():
     """ Introspecção: Escolhe um tema falado recentemente e aprofunda conhecimento. """
     print("💤 [Dream] Introspecção Web...")
     try:
-        conn = sqlite3.connect(config.DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT text FROM memories ORDER BY RANDOM() LIMIT 1")
-        row = cursor.fetchone()
-        conn.close()
+        with db_connection() as conn:
+            row = conn.execute("SELECT text FROM memories ORDER BY RANDOM() LIMIT 1").fetchone()
         
         if not row: return
         
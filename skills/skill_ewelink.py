@@ -12,6 +12,8 @@ CACHE_FILE = "/opt/phantasma/cache/ewelink_cache.json"
 POLL_INTERVAL = 60  
 
 TRIGGER_TYPE = "contains"
+# Controla o carregador do carro, não pode correr em paralelo com outras skills
+SPECULATIVE = False
 TRIGGERS = ["carregador", "carro", "ewelink", "tomada do carro"]
 
 ACTIONS_ON = ["liga", "ligar", "acende", "ativa", "inicia", "põe a carregar"]
@@ -1,4 +1,6 @@
 TRIGGER_TYPE = "contains"
+# Respostas fixas, sem efeitos
+SPECULATIVE = True
 TRIGGERS = ["lucid status", "veganismo", "dissertacao", "conferencia", "ativistas", "videos", "anarquismo", "veganismo e anarquismo"]
 
 def get_veganismo_info():
@@ -1,28 +1,18 @@
 # vim skill_memory.py
-import config
-import ollama
 import json
 import re
 import ast  # Para lidar com dicionários mal formatados
 from datetime import datetime
 from data_utils import save_to_rag
+from llm_utils import LLM
 
 TRIGGER_TYPE = "startswith"
+# Grava no RAG: não é especulativa
+SPECULATIVE = False
 TRIGGERS = ["memoriza", "lembra-te disto", "grava isto", "guarda isto", "anota"]
 
 def _safe_ollama_chat(prompt):
-    targets = [
-        (getattr(config, 'OLLAMA_HOST_PRIMARY', None), getattr(config, 'OLLAMA_MODEL_PRIMARY', 'llama3')),
-        (getattr(config, 'OLLAMA_HOST_FALLBACK', 'http://localhost:11434'), getattr(config, 'OLLAMA_MODEL_FALLBACK', 'llama3'))
-    ]
-    for host, model in targets:
-        if not host: continue
-        try:
-            client = ollama.Client(host=host, timeout=config.OLLAMA_TIMEOUT)
-            resp = client.chat(model=model, messages=[{'role': 'user', 'content': prompt}])
-            return resp['message']['content']
-        except: continue
-    return None
+    return LLM.chat([{'role': 'user', 'content': prompt}])
 
 def handle(user_prompt_lower, user_prompt_full):
     trigger_found = next((t for t in TRIGGERS if user_prompt_lower.startswith(t)), None)
@@ -2,6 +2,8 @@
 from audio_utils import play_tts, play_random_song_full
 
 TRIGGER_TYPE = "contains"
+# Toca TTS e música dentro do handle: fora do routing paralelo
+SPECULATIVE = False
 TRIGGERS = ["música", "som"]
 
 # Gatilhos de Ação (para evitar falsos positivos)
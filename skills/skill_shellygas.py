@@ -3,6 +3,8 @@ import config
 
 # --- Configuração da Skill ---
 TRIGGER_TYPE = "contains"
+# Só consulta o sensor, não mexe em nada
+SPECULATIVE = True
 TRIGGERS = [
     "alarme de gás", 
     "alarme do gás", 
@@ -6,6 +6,8 @@ import os
 import config
 
 TRIGGER_TYPE = "contains"
+# Só lê métricas da máquina
+SPECULATIVE = True
 # Gatilhos de sistema
 TRIGGERS = ["estado do sistema", "cpu", "ram", "memória", "disco", "armazenamento", "status do servidor"]
 
@@ -17,6 +17,8 @@ except ImportError:
 
 # --- Configuração ---
 TRIGGER_TYPE = "contains"
+# Atua nas tomadas/luzes Tuya: o router paralelo só a corre quando chega a vez dela
+SPECULATIVE = False
 CACHE_FILE = "/opt/phantasma/cache/tuya_cache.json"
 PORTS_TO_LISTEN = [6666, 6667]
 POLL_COOLDOWN = 10 
@@ -3,6 +3,8 @@ import re, httpx, unicodedata, config, json, os, time, threading
 from datetime import datetime
 
 TRIGGER_TYPE = "contains"
+# Só lê a previsão (cache do IPMA): segura para correr em paralelo
+SPECULATIVE = True
 TRIGGERS = ["tempo", "clima", "meteorologia", "previsão", "vai chover", "vai estar", "frio", "calor", "qualidade do ar"]
 
 CACHE_FILE = "/opt/phantasma/cache/weather_cache.json"
@@ -31,6 +31,8 @@ VACUUM_HOME = ["base", "casa", "volta", "carrega", "recolhe"]
 
 # --- Configuração da Skill (Triggers Dinâmicos) ---
 TRIGGER_TYPE = "contains"
+# Liga lâmpadas e manda o aspirador: nunca corre de forma especulativa
+SPECULATIVE = False
 
 def _get_triggers():
     """ Gera triggers baseados nos dispositivos configurados no config.py """
@@ -0,0 +1,151 @@
+import threading
+import numpy as np
+
+# --- RING BUFFER (Captura -> Motor) ---
+class AudioRingBuffer:
+    """
+    Buffer circular pré-alocado de amostras int16 (1 produtor, 1 consumidor).
+    O callback do sounddevice escreve, o loop do motor lê. Os cursores são
+    contadores monotónicos: só o produtor mexe no de escrita e só o consumidor
+    mexe no de leitura, por isso não há locks no caminho do áudio.
+    """
+    def __init__(self, capacity, max_backlog=None, dtype=np.int16):
+        self.capacity = int(capacity)
+        self.buffer = np.zeros(self.capacity, dtype=dtype)
+        # Backlog máximo antes de deitarmos fora áudio velho (por omissão, metade do buffer)
+        self.max_backlog = int(max_backlog) if max_backlog else self.capacity // 2
+        self.write_pos = 0
+        self.read_pos = 0
+        self.dropped = 0
+        self._data_ready = threading.Event()
+
+    def write(self, data):
+        """ Chamado pelo callback de áudio. Nunca bloqueia nem aloca. """
+        n = len(data)
+        if n > self.capacity: data = data[-self.capacity:]; n = self.capacity
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self.buffer[start:start + first] = data[:first]
+        if first < n: self.buffer[:n - first] = data[first:]
+        self.write_pos += n
+        self._data_ready.set()
+
+    def backlog(self):
+        return self.write_pos - self.read_pos
+
+    def drop_stale(self, keep=None):
+        """ Salta o áudio atrasado, mantendo apenas as 'keep' amostras mais recentes. """
+        keep = self.max_backlog if keep is None else keep
+        excess = self.backlog() - keep
+        if excess > 0:
+            self.read_pos += excess
+            self.dropped += excess
+        return max(excess, 0)
+
+    def clear(self):
+        self.drop_stale(keep=0)
+
+    def latest(self, n):
+        """ Cópia das últimas n amostras escritas (pré-roll), sem mexer no cursor de leitura. """
+        n = min(int(n), self.write_pos, self.capacity)
+        out = np.empty(n, dtype=self.buffer.dtype)
+        start = (self.write_pos - n) % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        if first < n: out[first:] = self.buffer[:n - first]
+        return out
+
+    def read_into(self, out, timeout=None):
+        """
+        Copia len(out) amostras para 'out' (pré-alocado). Bloqueia até haver dados.
+        Retorna o nº de amostras descartadas por atraso, ou None em timeout.
+        """
+        n = len(out)
+        while self.backlog() < n:
+            self._data_ready.clear()
+            if self.backlog() >= n: break
+            if not self._data_ready.wait(timeout): return None
+
+        # Política de backlog limitado: se o CPU esteve ocupado (Whisper/Ollama),
+        # preferimos perder áudio antigo a acumular segundos de latência.
+        dropped = self.drop_stale(keep=max(self.max_backlog, n))
+
+        start = self.read_pos % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        if first < n: out[first:] = self.buffer[:n - first]
+        self.read_pos += n
+        return dropped
+
+# --- RESAMPLER POLIFÁSICO (Qualquer rate -> 16 kHz) ---
+class StreamingResampler:
+    """
+    Resampler racional (up/down) com filtro FIR polifásico e estado entre chunks.
+    Substitui a decimação 'audio[::N]' (que faz aliasing e não suporta 44.1 kHz).
+    Os índices de cada chunk são calculados uma vez e reutilizados, por isso
+    com blocos de tamanho fixo o custo é só o gather + produto.
+    """
+    def __init__(self, rate_in, rate_out=16000, zero_crossings=8, rolloff=0.9, beta=8.0):
+        g = np.gcd(int(rate_in), int(rate_out))
+        self.rate_in, self.rate_out = int(rate_in), int(rate_out)
+        self.up, self.down = self.rate_out // g, self.rate_in // g
+        self.passthrough = self.up == self.down
+
+        # Filtro passa-baixo (windowed sinc) desenhado no domínio sobre-amostrado
+        factor = max(self.up, self.down)
+        half = zero_crossings * factor
+        n = np.arange(-half, half + 1, dtype=np.float64)
+        cutoff = rolloff / factor
+        h = cutoff * np.sinc(cutoff * n) * np.kaiser(len(n), beta)
+        h *= self.up / h.sum()
+
+        # Decomposição polifásica: fase p usa h[p], h[p+up], h[p+2up], ...
+        self.taps = -(-len(h) // self.up)
+        h = np.concatenate([h, np.zeros(self.taps * self.up - len(h))])
+        self.phases = h.reshape(self.taps, self.up).T.astype(np.float32).copy()
+        self.latency = half / (self.up * self.rate_in)  # Atraso do filtro em segundos
+
+        self.history = np.zeros(self.taps - 1, dtype=np.float32)
+        self.offset = 0  # Posição da próxima saída (em unidades 'up') relativa ao início do chunk
+        self._plans = {}
+
+    def output_size(self, n_in):
+        """ Nº de amostras de saída que um chunk de n_in amostras vai produzir (a partir do estado atual). """
+        if self.passthrough: return n_in
+        return max(0, -(-(n_in * self.up - self.offset) // self.down))
+
+    def _plan(self, n_in):
+        key = (self.offset, n_in)
+        plan = self._plans.get(key)
+        if plan is None:
+            m = self.output_size(n_in)
+            t = self.offset + np.arange(m, dtype=np.int64) * self.down
+            base = (t // self.up) + (self.taps - 1)
+            idx = base[:, None] - np.arange(self.taps)[None, :]
+            plan = (idx, self.phases[t % self.up], m)
+            if len(self._plans) > 64: self._plans.clear()
+            self._plans[key] = plan
+        return plan
+
+    def process(self, chunk):
+        """ Recebe int16/float32 e devolve float32 no rate de saída (mesma escala da entrada). """
+        x = np.asarray(chunk, dtype=np.float32).reshape(-1)
+        if self.passthrough: return x
+        idx, coeffs, m = self._plan(len(x))
+        buf = np.concatenate([self.history, x])
+        y = np.einsum('mk,mk->m', buf[idx], coeffs) if m else np.zeros(0, dtype=np.float32)
+        self.offset += m * self.down - len(x) * self.up
+        self.history = buf[len(buf) - (self.taps - 1):] if self.taps > 1 else self.history
+        return y
+
+    def process_int16(self, chunk, out=None):
+        """ Igual a process(), mas devolve int16 (formato que o openWakeWord e o VAD esperam). """
+        y = self.process(chunk)
+        if out is None: out = np.empty(len(y), dtype=np.int16)
+        np.clip(y, -32768, 32767, out=y)
+        out[:len(y)] = y
+        return out[:len(y)]
+
+    def reset(self):
+        self.history[:] = 0
+        self.offset = 0
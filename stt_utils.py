@@ -0,0 +1,190 @@
+import re
+import json
+import queue
+import threading
+import numpy as np
+import config
+
+# --- PÓS-PROCESSAMENTO ---
+HALLUCINATIONS = [".", "?", "Obrigado", "Sous-titres"]
+
+def clean_transcript(text):
+    """ Filtra alucinações curtas do Whisper e aplica os PHONETIC_FIXES do config. """
+    text = (text or "").strip()
+    if any(h in text for h in HALLUCINATIONS) and len(text) < 5: return ""
+    if hasattr(config, 'PHONETIC_FIXES'):
+        for k, v in config.PHONETIC_FIXES.items():
+            if k in text.lower(): text = re.sub(re.escape(k), v, text, flags=re.IGNORECASE)
+    return text
+
+# --- MOTORES STT ---
+class WhisperBackend:
+    """ openai-whisper de referência (PyTorch). """
+    name = "whisper"
+    def __init__(self, model_name, threads):
+        import torch
+        import whisper
+        if threads: torch.set_num_threads(threads)
+        self.model = whisper.load_model(model_name)
+
+    def transcribe(self, audio, initial_prompt=None):
+        res = self.model.transcribe(audio, language='pt', fp16=False, initial_prompt=initial_prompt)
+        return res['text']
+
+class FasterWhisperBackend:
+    """ faster-whisper (CTranslate2) com quantização int8 no CPU. """
+    name = "faster-whisper"
+    def __init__(self, model_name, threads):
+        from faster_whisper import WhisperModel
+        compute_type = getattr(config, 'STT_COMPUTE_TYPE', 'int8')
+        self.beam_size = getattr(config, 'STT_BEAM_SIZE', 1)
+        self.model = WhisperModel(model_name, device="cpu", compute_type=compute_type, cpu_threads=threads or 0)
+
+    def transcribe(self, audio, initial_prompt=None):
+        segments, _ = self.model.transcribe(audio, language='pt', beam_size=self.beam_size, initial_prompt=initial_prompt)
+        return "".join(seg.text for seg in segments)
+
+class WhisperCppBackend:
+    """ whisper.cpp através dos bindings pywhispercpp (modelos ggml, ex: 'medium-q5_0'). """
+    name = "whisper.cpp"
+    def __init__(self, model_name, threads):
+        from pywhispercpp.model import Model
+        self.model = Model(model_name, n_threads=threads or 4, print_progress=False, print_realtime=False)
+
+    def transcribe(self, audio, initial_prompt=None):
+        params = {"language": "pt"}
+        if initial_prompt: params["initial_prompt"] = initial_prompt
+        segments = self.model.transcribe(audio.astype(np.float32), **params)
+        return "".join(seg.text for seg in segments)
+
+STT_BACKENDS = {
+    "whisper": WhisperBackend,
+    "faster-whisper": FasterWhisperBackend,
+    "whisper.cpp": WhisperCppBackend,
+}
+
+def load_stt_backend():
+    """ Carrega o motor definido em STT_ENGINE; se falhar, cai para o openai-whisper. """
+    engine = getattr(config, 'STT_ENGINE', 'whisper')
+    whisper_model = getattr(config, 'WHISPER_MODEL', 'base')
+    threads = getattr(config, 'WHISPER_THREADS', None)
+    candidates = [(engine, getattr(config, 'STT_MODEL', None) or whisper_model), ("whisper", whisper_model)]
+    if engine == "whisper": candidates = candidates[:1]
+    for name, model_name in candidates:
+        try:
+            backend = STT_BACKENDS[name](model_name, threads)
+            print(f"🗣️ STT: {backend.name} ({model_name}, {threads} threads)")
+            return backend
+        except Exception as e:
+            print(f"⚠️ STT '{name}' indisponível: {e}")
+    return None
+
+# --- CAMINHO RÁPIDO (Comandos de domótica) ---
+# Palavras de ligação que aparecem entre a ação e o nome do dispositivo ("liga a luz da sala")
+COMMAND_FILLER_WORDS = ["a", "o", "as", "os", "da", "do", "das", "dos", "de", "na", "no", "em", "e",
+                        "luz", "luzes", "todas", "todos", "por", "favor", "phantasma", "fantasma"]
+
+def build_command_phrases(skills):
+    """
+    Vocabulário fechado a partir dos TRIGGERS das skills 'contains' e dos nomes dos
+    dispositivos no config. As skills 'startswith' (diz..., memoriza...) levam texto livre,
+    por isso ficam de fora e vão sempre ao Whisper.
+    """
+    phrases = set(COMMAND_FILLER_WORDS)
+    for s in skills:
+        if s.get('trigger_type') != 'contains': continue
+        phrases.update(str(t).lower() for t in s.get('triggers', []))
+    for attr in ['TUYA_DEVICES', 'MIIO_DEVICES', 'EWELINK_DEVICES', 'CLOOGY_DEVICES']:
+        phrases.update(str(k).lower() for k in (getattr(config, attr, None) or {}))
+    # Só palavras (o Vosk não conhece "+", "x", "-")
+    return sorted(p for p in phrases if re.fullmatch(r"[^\W\d_]+(?:[\s-][^\W\d_]+)*", p))
+
+class CommandRecognizer:
+    """
+    Descodificação com gramática fechada (Vosk/Kaldi) para comandos curtos.
+    Muito mais rápido que o Whisper; se aparecer [unk] ou a confiança for baixa,
+    o chamador cai para o STT completo.
+    """
+    def __init__(self, model_path, phrases):
+        from vosk import Model, KaldiRecognizer, SetLogLevel
+        SetLogLevel(-1)
+        self._recognizer_cls = KaldiRecognizer
+        self.model = Model(model_path)
+        self.grammar = json.dumps(list(phrases) + ["[unk]"], ensure_ascii=False)
+
+    def recognize(self, audio):
+        """ Devolve (texto, confiança média) para áudio float32 a 16 kHz. """
+        rec = self._recognizer_cls(self.model, 16000, self.grammar)
+        rec.SetWords(True)
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+        rec.AcceptWaveform(pcm)
+        res = json.loads(rec.FinalResult())
+        words = res.get('result', [])
+        text = res.get('text', '').strip()
+        if not words or not text or "[unk]" in text: return text, 0.0
+        return text, sum(w.get('conf', 0.0) for w in words) / len(words)
+
+def load_command_recognizer(skills):
+    """ Cria o CommandRecognizer se STT_FAST_PATH_MODEL estiver definido (senão None). """
+    model_path = getattr(config, 'STT_FAST_PATH_MODEL', None)
+    if not model_path: return None
+    try:
+        phrases = build_command_phrases(skills)
+        rec = CommandRecognizer(model_path, phrases)
+        print(f"⚡ STT rápido: Vosk com {len(phrases)} frases de comando")
+        return rec
+    except Exception as e:
+        print(f"⚠️ STT rápido indisponível: {e}")
+        return None
+
+# --- TRANSCRIÇÃO INCREMENTAL ---
+class StreamingTranscriber:
+    """
+    Transcreve segmentos (cortados pelo VAD nas pausas) enquanto o utilizador ainda fala.
+    Quando a fala termina só falta descodificar o último segmento.
+    'transcribe_fn(audio, prompt)' devolve o texto cru de um segmento a 16 kHz.
+    """
+    def __init__(self, transcribe_fn, on_partial=None):
+        self.transcribe_fn = transcribe_fn
+        self.on_partial = on_partial
+        self.segments = []
+        self.cancelled = False
+        self.jobs = queue.Queue()
+        self.done = threading.Event()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    @property
+    def partial(self):
+        """ Hipótese parcial (texto dos segmentos já descodificados). """
+        return " ".join(t for t in self.segments if t).strip()
+
+    def feed(self, audio, final=False):
+        """ Chamado pelo record_audio em cada pausa (final=True no fim da fala). """
+        if audio is not None and len(audio): self.jobs.put(audio)
+        if final: self.jobs.put(None)
+
+    def _run(self):
+        base_prompt = getattr(config, 'WHISPER_INITIAL_PROMPT', None) or ""
+        while True:
+            audio = self.jobs.get()
+            if audio is None: break
+            if self.cancelled: continue
+            try:
+                # O texto anterior entra no prompt para dar continuidade entre segmentos
+                prompt = f"{base_prompt} {self.partial}".strip() or None
+                text = (self.transcribe_fn(audio, prompt) or "").strip()
+                if any(h in text for h in HALLUCINATIONS) and len(text) < 5: text = ""
+                self.segments.append(text)
+                if self.on_partial and text: self.on_partial(self.partial)
+            except Exception as e: print(f"⚠️ STT parcial falhou: {e}")
+        self.done.set()
+
+    def cancel(self):
+        """ Descarta os segmentos pendentes (ex: o caminho rápido já resolveu o comando). """
+        self.cancelled = True
+
+    def result(self, timeout=None):
+        """ Espera pelo último segmento e devolve o texto final já limpo. """
+        self.done.wait(timeout)
+        return clean_transcript(self.partial)
@@ -0,0 +1,177 @@
+import time
+import threading
+import collections
+
+# --- PRIMITIVAS ---
+class LatencyStats:
+    """ Janela deslizante de latências (segundos) com percentis em ms. """
+    def __init__(self, window=2000):
+        self.samples = collections.deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self):
+        data = sorted(self.samples)
+        if not data: return {"count": self.count}
+        def pct(p): return round(data[min(len(data) - 1, int(p / 100 * len(data)))] * 1000, 2)
+        return {
+            "count": self.count, "window": len(data),
+            "mean_ms": round(sum(data) / len(data) * 1000, 2),
+            "p50_ms": pct(50), "p90_ms": pct(90), "p99_ms": pct(99),
+            "max_ms": round(data[-1] * 1000, 2),
+        }
+
+class Histogram:
+    """ Histograma de scores entre 0 e 1 em 'bins' caixas iguais. """
+    def __init__(self, bins=20):
+        self.bins = bins
+        self.counts = [0] * bins
+
+    def add(self, value):
+        self.counts[min(self.bins - 1, max(0, int(value * self.bins)))] += 1
+
+    def summary(self):
+        step = 1.0 / self.bins
+        return {f"{i * step:.2f}": c for i, c in enumerate(self.counts)}
+
+# --- HOTWORD ---
+class WakewordTelemetry:
+    """ Métricas do motor de hotword (latência, backlog, scores, streaks e deteções). """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.inference = LatencyStats()
+        self.chunk_ms = 80
+        self.scores = collections.defaultdict(Histogram)
+        self.events = collections.defaultdict(lambda: collections.Counter())
+        self.detections = collections.deque(maxlen=5000) # (timestamp, modelo, score, quiet)
+        self.quiet_triggers = 0
+        self.chunks = 0
+        self.gated_chunks = 0 # Chunks que a porta de silêncio não deixou chegar ao modelo
+        self.backlog_ms = 0.0
+        self.max_backlog_ms = 0.0
+        self.dropped_samples = 0
+        self.gate = None
+
+    def record_chunk(self, latency, scores, backlog_samples=0, dropped=0, scored=True):
+        """ Com scored=False (porta fechada) só conta o chunk: latência e scores seriam zeros artificiais. """
+        with self.lock:
+            self.chunks += 1
+            if scored:
+                if latency is not None: self.inference.add(latency)
+                for name, score in scores.items(): self.scores[name].add(score)
+            else: self.gated_chunks += 1
+            self.backlog_ms = backlog_samples / 16.0
+            self.max_backlog_ms = max(self.max_backlog_ms, self.backlog_ms)
+            self.dropped_samples += dropped or 0
+
+    def record_event(self, model, event):
+        """ Eventos do tracker: 'start' (streak começou), 'patience' (falha tolerada), 'broken' (streak perdido). """
+        if not event: return
+        with self.lock: self.events[model][event] += 1
+
+    def record_detection(self, model, score, quiet=False):
+        with self.lock:
+            self.detections.append((time.time(), model, round(float(score), 4), quiet))
+            if quiet: self.quiet_triggers += 1
+
+    def snapshot(self):
+        with self.lock:
+            now = time.time()
+            per_hour = collections.Counter()
+            for ts, model, score, quiet in self.detections:
+                if now - ts <= 86400: per_hour[time.strftime("%Y-%m-%d %H:00", time.localtime(ts))] += 1
+            inference = self.inference.summary()
+            uptime_h = max((now - self.started) / 3600, 1e-6)
+            data = {
+                "uptime_s": round(now - self.started, 1),
+                "chunks": self.chunks,
+                "gated_chunks": self.gated_chunks,
+                "inference": inference,
+                # < 1.0 significa que a inferência acompanha o tempo real (80ms de áudio por chunk)
+                "realtime_factor": round(inference.get("p50_ms", 0) / self.chunk_ms, 4),
+                "backlog_ms": round(self.backlog_ms, 1),
+                "max_backlog_ms": round(self.max_backlog_ms, 1),
+                "dropped_samples": self.dropped_samples,
+                "dropped_ms": round(self.dropped_samples / 16.0, 1),
+                "score_histograms": {name: h.summary() for name, h in self.scores.items()},
+                "tracker_events": {name: dict(c) for name, c in self.events.items()},
+                "detections_total": len(self.detections),
+                "detections_per_hour_avg": round(len(self.detections) / uptime_h, 3),
+                "detections_per_hour": dict(sorted(per_hour.items())),
+                "quiet_hours_triggers": self.quiet_triggers,
+                "last_detections": [
+                    {"ts": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)), "model": m, "score": s, "quiet": q}
+                    for ts, m, s, q in list(self.detections)[-10:]
+                ],
+            }
+            if self.gate is not None:
+                total = self.gate.skipped + self.gate.passed
+                data["gate"] = {"skipped": self.gate.skipped, "passed": self.gate.passed,
+                                "skip_ratio": round(self.gate.skipped / total, 4) if total else 0.0}
+            return data
+
+# --- SKILLS ---
+class SkillTelemetry:
+    """ Por skill: quantas vezes casou nos triggers, respondeu, recusou (None), rebentou ou excedeu o prazo. """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stats = collections.defaultdict(lambda: {"counts": collections.Counter(), "latency": LatencyStats(500), "last_error": None})
+        self.requests = 0
+        self.fallthrough = 0 # Pedidos em que houve skills candidatas mas todas recusaram (foi para o LLM)
+
+    def record_request(self, candidates):
+        with self.lock:
+            self.requests += 1
+            for name in candidates: self.stats[name]["counts"]["matched"] += 1
+
+    def record(self, name, outcome, elapsed=None, error=None):
+        """ outcome: 'answered' | 'declined' | 'error' | 'timeout' | 'preempted' (correu em paralelo mas ganhou outra) """
+        with self.lock:
+            st = self.stats[name]
+            st["counts"][outcome] += 1
+            if elapsed is not None: st["latency"].add(elapsed)
+            if error is not None: st["last_error"] = f"{type(error).__name__}: {error}"
+
+    def record_fallthrough(self):
+        with self.lock: self.fallthrough += 1
+
+    def snapshot(self):
+        with self.lock:
+            skills = {}
+            for name, st in self.stats.items():
+                c = st["counts"]
+                skills[name] = {
+                    **{k: c.get(k, 0) for k in ["matched", "answered", "declined", "error", "timeout", "preempted"]},
+                    "hit_rate": round(c.get("answered", 0) / c["matched"], 3) if c.get("matched") else None,
+                    "latency": st["latency"].summary(),
+                    "last_error": st["last_error"],
+                }
+            return {"uptime_s": round(time.time() - self.started, 1), "requests": self.requests,
+                    "fallthrough_to_llm": self.fallthrough, "skills": skills}
+
+    def log_summary(self):
+        snap = self.snapshot()
+        print(f"📊 Skills: {snap['requests']} pedidos, {snap['fallthrough_to_llm']} caíram para o LLM")
+        ranked = sorted(snap["skills"].items(), key=lambda kv: kv[1]["latency"].get("p90_ms", 0), reverse=True)
+        for name, st in ranked:
+            lat = st["latency"]
+            print(f"   {name}: casou {st['matched']} | respondeu {st['answered']} | recusou {st['declined']} | "
+                  f"erros {st['error']} | timeouts {st['timeout']} | p50 {lat.get('p50_ms', '-')} ms | p90 {lat.get('p90_ms', '-')} ms")
+
+    def start_periodic_log(self, interval):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try: self.log_summary()
+                except Exception as e: print(f"⚠️ Erro no resumo de skills: {e}")
+        threading.Thread(target=loop, daemon=True).start()
+
+WAKEWORD_METRICS = WakewordTelemetry()
+SKILL_METRICS = SkillTelemetry()
@@ -1,6 +1,169 @@
+import os
+import re
+import json
+import time
+import atexit
+import zlib
+import random
+import threading
+import unicodedata
+import collections
 import httpx
 import config
 
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36"
+}
+
+# --- CLIENTE PERSISTENTE ---
+# Um só cliente para o processo todo: reaproveita as ligações keep-alive ao SearxNG
+_client = None
+_client_lock = threading.Lock()
+
+def _get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(timeout=getattr(config, 'SEARXNG_TIMEOUT', 10.0), headers=HEADERS,
+                                   limits=httpx.Limits(max_connections=8, max_keepalive_connections=4))
+        return _client
+
+def _search_params(prompt):
+    """ Parâmetros do pedido; engines/categorias/intervalo/língua vêm do config (None = o que o SearxNG tiver por omissão). """
+    params = {'q': prompt, 'format': 'json'}
+    for key, attr in [('engines', 'SEARXNG_ENGINES'), ('categories', 'SEARXNG_CATEGORIES'),
+                      ('time_range', 'SEARXNG_TIME_RANGE'), ('language', 'SEARXNG_LANGUAGE')]:
+        value = getattr(config, attr, None)
+        if isinstance(value, (list, tuple)): value = ",".join(value)
+        if value: params[key] = value
+    return params
+
+# --- CACHE DE RESULTADOS (memória + disco opcional) ---
+class SearchCache:
+    """
+    Snippets já sem repetidos por query normalizada (e parâmetros), com TTL e LRU.
+    Com SEARXNG_CACHE_PATH definido, sobrevive a reinícios: o JSON é gravado em fundo
+    a cada SEARXNG_CACHE_SAVE_INTERVAL segundos (só se houve alterações) e à saída.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.entries = collections.OrderedDict() # chave -> (expira, snippets, nº pedido quando foi guardado)
+        self.loaded = False
+        self.dirty = False
+        self.saver_started = False
+        self.hits = self.misses = 0
+
+    def _path(self):
+        return getattr(config, 'SEARXNG_CACHE_PATH', None)
+
+    def _load(self):
+        self.loaded = True
+        path = self._path()
+        if not path or not os.path.exists(path): return
+        try:
+            with open(path, encoding="utf-8") as f: data = json.load(f)
+            now = time.time()
+            for key, entry in data.items():
+                if len(entry) == 3 and entry[0] > now: self.entries[key] = tuple(entry)
+        except Exception as e: print(f"AVISO (Web RAG): Cache de pesquisa ilegível, a ignorar: {e}")
+
+    def flush(self):
+        """ Grava no disco se houver alterações (o dump é feito fora do lock das pesquisas). """
+        path = self._path()
+        if not path: return
+        with self.lock:
+            if not self.dirty: return
+            snapshot, self.dirty = dict(self.entries), False
+        with self.save_lock:
+            try:
+                tmp = f"{path}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f: json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp, path)
+            except Exception as e: print(f"AVISO (Web RAG): Falha ao gravar cache de pesquisa: {e}")
+
+    def _start_saver(self):
+        if self.saver_started or not self._path(): return
+        self.saver_started = True
+        atexit.register(self.flush)
+        def loop():
+            while True:
+                time.sleep(getattr(config, 'SEARXNG_CACHE_SAVE_INTERVAL', 60))
+                self.flush()
+        threading.Thread(target=loop, daemon=True).start()
+
+    def get(self, key, max_results):
+        with self.lock:
+            if not self.loaded: self._load()
+            item = self.entries.get(key)
+            if item and item[0] > time.time():
+                # Guardado para um pedido mais pequeno e cortado: não chega para este
+                if max_results > item[2] and len(item[1]) >= item[2]: self.misses += 1; return None
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return item[1][:max_results]
+            if item: del self.entries[key]; self.dirty = True
+            self.misses += 1
+            return None
+
+    def put(self, key, snippets, max_results):
+        ttl = getattr(config, 'SEARXNG_CACHE_TTL', 3600)
+        if not ttl: return
+        with self.lock:
+            if not self.loaded: self._load()
+            self.entries[key] = (time.time() + ttl, snippets, max_results)
+            self.entries.move_to_end(key)
+            while len(self.entries) > getattr(config, 'SEARXNG_CACHE_MAX_ENTRIES', 500): self.entries.popitem(last=False)
+            self.dirty = True
+            self._start_saver()
+
+    def stats(self):
+        with self.lock: return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+SEARCH_CACHE = SearchCache()
+
+def _normalize_query(prompt, params):
+    """ Minúsculas, sem acentos nem pontuação; os parâmetros do pedido também fazem parte da chave. """
+    text = unicodedata.normalize("NFKD", prompt.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = " ".join(re.findall(r"\w+", text))
+    extra = "|".join(f"{k}={v}" for k, v in sorted(params.items()) if k not in ('q', 'format'))
+    return f"{text}|{extra}"
+
+# --- SNIPPETS QUASE IGUAIS (MinHash) ---
+_MINHASH_PERMS = 64
+_MINHASH_PRIME = (1 << 61) - 1
+_rng = random.Random(1337) # Fixo: as assinaturas têm de ser comparáveis entre chamadas
+_MINHASH_COEFS = [(_rng.randrange(1, _MINHASH_PRIME), _rng.randrange(0, _MINHASH_PRIME)) for _ in range(_MINHASH_PERMS)]
+
+def _shingles(text, k=3):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < k: return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+def _minhash(text):
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in _shingles(text)]
+    if not hashes: return None
+    return [min((a * h + b) % _MINHASH_PRIME for h in hashes) for a, b in _MINHASH_COEFS]
+
+def _similarity(sig_a, sig_b):
+    """ Estimativa de Jaccard entre os conjuntos de shingles. """
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / _MINHASH_PERMS
+
+def _dedup_snippets(results, max_results):
+    """ Primeiros 'max_results' snippets, saltando os que são quase cópia de um já escolhido (agregadores, mirrors). """
+    threshold = getattr(config, 'SEARXNG_DEDUP_THRESHOLD', 0.6)
+    chosen, signatures = [], []
+    for res in results:
+        content = (res.get('content') or "").strip()
+        if not content: continue
+        sig = _minhash(content)
+        if sig is None or any(_similarity(sig, s) >= threshold for s in signatures): continue
+        chosen.append(content); signatures.append(sig)
+        if len(chosen) >= max_results: break
+    return chosen
+
+# --- PESQUISA ---
 def search_with_searxng(prompt, max_results=3):
     """
     Pesquisa na web usando SearxNG e retorna snippets de contexto.
@@ -8,38 +171,34 @@ def search_with_searxng(prompt, max_results=3):
     if not config.SEARXNG_URL:
         return "" # Ignora se a URL não estiver definida
 
-    print(f"A pesquisar na web (SearxNG): '{prompt}'")
-    try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36"
-        }
-        
-        client = httpx.Client(timeout=10.0, headers=headers)
-        response = client.get(
-            f"{config.SEARXNG_URL}/search",
-            params={'q': prompt, 'format': 'json'}
-        )
-        response.raise_for_status()
-        data = response.json()
-        
-        results = data.get('results', [])
-        if not results:
-            print("Web RAG: Nenhum resultado encontrado.")
+    params = _search_params(prompt)
+    key = _normalize_query(prompt, params)
+    snippets = SEARCH_CACHE.get(key, max_results)
+    if snippets is not None:
+        print(f"A pesquisar na web (SearxNG, cache): '{prompt}'")
+    else:
+        print(f"A pesquisar na web (SearxNG): '{prompt}'")
+        try:
+            response = _get_client().get(f"{config.SEARXNG_URL}/search", params=params)
+            response.raise_for_status()
+            data = response.json()
+        except httpx.ConnectError:
+            print(f"ERRO (Web RAG): Não foi possível ligar ao SearxNG em {config.SEARXNG_URL}")
+            return ""
+        except Exception as e:
+            print(f"ERRO (Web RAG): Falha ao pesquisar no SearxNG: {e}")
             return ""
+        # Só se guarda o que vai para o prompt (o JSON completo traz muito lixo)
+        snippets = _dedup_snippets(data.get('results', []), max_results)
+        if snippets: SEARCH_CACHE.put(key, snippets, max_results)
 
-        context_str = "CONTEXTO DA WEB (Usa isto para responder se for relevante):\n"
-        count = 0
-        for res in results:
-            if res.get('content') and count < max_results:
-                context_str += f"- {res['content']}\n"
-                count += 1
-        
-        print(f"Web RAG: Contexto encontrado:\n{context_str}")
-        return context_str
-
-    except httpx.ConnectError:
-        print(f"ERRO (Web RAG): Não foi possível ligar ao SearxNG em {config.SEARXNG_URL}")
-        return ""
-    except Exception as e:
-        print(f"ERRO (Web RAG): Falha ao pesquisar no SearxNG: {e}")
+    if not snippets:
+        print("Web RAG: Nenhum resultado encontrado.")
         return ""
+
+    context_str = "CONTEXTO DA WEB (Usa isto para responder se for relevante):\n"
+    for content in snippets:
+        context_str += f"- {content}\n"
+
+    print(f"Web RAG: Contexto encontrado:\n{context_str}")
+    return context_str
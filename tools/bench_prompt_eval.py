@@ -0,0 +1,74 @@
+import os
+import sys
+import argparse
+import numpy as np
+
+# Permite importar os módulos do Phantasma a partir da pasta tools/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+import ollama
+from llm_utils import build_llm_messages, LLM_RESPONSE_INSTRUCTIONS
+
+# CONFIGURAÇÕES
+PERGUNTAS = [
+    "Quem escreveu Os Lusíadas?",
+    "Qual é a capital da Austrália?",
+    "Explica-me o que é um buraco negro.",
+    "Que filme me recomendas para hoje?",
+    "Quanto tempo demora a cozer um ovo?",
+]
+RAG_EXEMPLO = "MEMÓRIAS PESSOAIS DO UTILIZADOR:\n- [2025-01-10 10:00:00] O utilizador prefere respostas curtas.\n"
+KEEP_ALIVE = "30m"
+
+def mensagens_antigas(prompt):
+    """ Formato anterior: tudo numa só mensagem de utilizador, sem mensagem de sistema. """
+    sys_prompt = getattr(config, 'SYSTEM_PROMPT', '')
+    full_p = (
+        f"{sys_prompt}\n\n"
+        "### CONHECIMENTO DISPONÍVEL (Usa apenas para factos):\n"
+        f"{RAG_EXEMPLO}\n\n\n\n"
+        f"{LLM_RESPONSE_INSTRUCTIONS}\n\n"
+        f"Utilizador: {prompt}"
+    )
+    return [{'role': 'user', 'content': full_p}]
+
+def medir(client, model, build, keep_alive, descarregar):
+    """ Só avaliação do prompt (num_predict=1). Devolve [(tokens avaliados, ms de prompt eval, ms de load)]. """
+    if descarregar:
+        try: client.generate(model=model, prompt="", keep_alive=0) # Tira o modelo da memória (arranque a frio)
+        except Exception: pass
+    res = []
+    for p in PERGUNTAS:
+        kwargs = {"keep_alive": keep_alive} if keep_alive is not None else {}
+        r = client.chat(model=model, messages=build(p), options={"num_predict": 1, "num_ctx": 8192, "temperature": 0}, **kwargs)
+        res.append((r.get('prompt_eval_count', 0), r.get('prompt_eval_duration', 0) / 1e6, r.get('load_duration', 0) / 1e6))
+    return res
+
+def resumo(nome, res):
+    tokens = [t for t, _, _ in res]
+    evals = [e for _, e, _ in res]
+    loads = [l for _, _, l in res]
+    print(f"\n📊 {nome}")
+    for p, (t, e, l) in zip(PERGUNTAS, res): print(f"   {p[:40]:<40} | {t:5d} tokens avaliados | eval {e:8.0f} ms | load {l:7.0f} ms")
+    print(f"   Média (sem a 1ª): {np.mean(tokens[1:]):.0f} tokens | eval {np.mean(evals[1:]):.0f} ms | load {np.mean(loads[1:]):.0f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara o tempo de prompt eval do formato antigo com o prefixo de sistema estável + keep_alive.")
+    parser.add_argument("--host", default=getattr(config, 'OLLAMA_HOST_FALLBACK', 'http://localhost:11434'))
+    parser.add_argument("--model", default=getattr(config, 'OLLAMA_MODEL_FALLBACK', 'llama3'))
+    parser.add_argument("--cold", action="store_true", help="Descarrega o modelo antes de cada modo")
+    args = parser.parse_args()
+
+    client = ollama.Client(host=args.host, timeout=getattr(config, 'OLLAMA_TIMEOUT', 600))
+    print(f"\n--- BENCHMARK PROMPT EVAL ---\n🤖 {args.host} ({args.model})")
+
+    antigo = medir(client, args.model, mensagens_antigas, None, args.cold)
+    resumo("Antes: mensagem única, keep_alive por omissão", antigo)
+    novo = medir(client, args.model, lambda p: build_llm_messages(p, RAG_EXEMPLO, "", ""), KEEP_ALIVE, args.cold)
+    resumo(f"Depois: sistema estável + sufixo variável, keep_alive={KEEP_ALIVE}", novo)
+
+    ganho = np.mean([e for _, e, _ in antigo[1:]]) - np.mean([e for _, e, _ in novo[1:]])
+    print(f"\n🚀 Prompt eval poupado por pergunta: {ganho:.0f} ms")
+
+if __name__ == "__main__":
+    main()
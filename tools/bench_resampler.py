@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+import numpy as np
+
+# Permite importar os módulos do Phantasma a partir da pasta tools/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stream_utils import StreamingResampler
+
+# CONFIGURAÇÕES
+RATES = [48000, 44100, 32000, 16000]  # Rates que o find_working_samplerate pode devolver
+CHUNK_OUT = 1280                       # Chunk do openWakeWord (80ms a 16kHz)
+ITERACOES = 2000
+
+def medir(rate):
+    r = StreamingResampler(rate, 16000)
+    read_size = -(-CHUNK_OUT * rate // 16000)
+    chunk = (np.random.randn(read_size) * 3000).astype(np.int16)
+    out = np.zeros(CHUNK_OUT + 2, dtype=np.int16)
+
+    for _ in range(20): r.process_int16(chunk, out=out)  # Aquecimento (cria os planos de índices)
+
+    tempos = np.empty(ITERACOES)
+    for i in range(ITERACOES):
+        t0 = time.perf_counter()
+        r.process_int16(chunk, out=out)
+        tempos[i] = time.perf_counter() - t0
+
+    tempos *= 1e6
+    budget = CHUNK_OUT / 16000 * 1e6  # 80ms de áudio por chunk
+    p50, p99 = np.percentile(tempos, [50, 99])
+    print(f"{rate:>6} Hz | up/down {r.up}/{r.down} | taps/fase {r.taps:>3} | "
+          f"p50 {p50:7.1f} µs | p99 {p99:7.1f} µs | {p50 / budget * 100:.2f}% de um core")
+
+def main():
+    print(f"\n--- BENCHMARK RESAMPLER ({ITERACOES} chunks de {CHUNK_OUT} amostras @ 16kHz) ---")
+    for rate in RATES: medir(rate)
+
+if __name__ == "__main__":
+    main()
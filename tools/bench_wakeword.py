@@ -0,0 +1,138 @@
+import os
+import sys
+import glob
+import time
+import wave
+import argparse
+import numpy as np
+
+# Permite importar os módulos do Phantasma a partir da pasta tools/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from stream_utils import StreamingResampler
+from wakeword import PhantasmaEngine, build_trackers, build_gate
+
+# CONFIGURAÇÕES (iguais ao main() do assistant.py)
+PASTA_POSITIVOS = "meus_samples_limpos"
+PASTA_NEGATIVOS = "meus_negativos"
+CHUNK_SIZE = 1280      # 80ms a 16kHz
+COOLDOWN_S = 2.0       # Depois de uma deteção o main ignora a hotword durante 2s
+PAD_S = 1.0            # Silêncio à volta de cada positivo (o modelo precisa de contexto)
+
+def ler_wav(path):
+    """ Lê um WAV PCM 16-bit e devolve (amostras int16 mono, sample rate). """
+    with wave.open(path, 'rb') as w:
+        if w.getsampwidth() != 2: raise ValueError("Só suporta PCM 16-bit")
+        data = np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+        if w.getnchannels() > 1: data = data[::w.getnchannels()]
+        return data, w.getframerate()
+
+class Replay:
+    """ Reproduz áudio pelo mesmo caminho do main(): blocos do device -> resampler -> motor -> trackers. """
+    def __init__(self, models, overrides, use_gate):
+        self.engine = PhantasmaEngine(models, gate=build_gate(CHUNK_SIZE) if use_gate else None)
+        if not self.engine.ready: sys.exit(1)
+        self.trackers = build_trackers(self.engine.model_names)
+        for tr in self.trackers:
+            for k, v in overrides.items():
+                if v is not None: setattr(tr, k, v)
+        self.chunks = 0
+        self.infer_time = 0.0
+
+    def reset(self):
+        self.engine.reset()
+        for tr in self.trackers: tr.reset()
+
+    def run(self, audio, rate):
+        """ Devolve a lista de deteções [(segundo, modelo, score)] no stream. """
+        resampler = StreamingResampler(rate, 16000)
+        read_size = -(-CHUNK_SIZE * rate // 16000)
+        out = np.zeros(CHUNK_SIZE + 2, dtype=np.int16)
+        detections, cooldown_until, t_audio = [], -1.0, 0.0
+        for i in range(0, len(audio) - read_size + 1, read_size):
+            raw = audio[i:i + read_size]
+            chunk = raw if resampler.passthrough else resampler.process_int16(raw, out=out)
+            t_audio = (i + read_size) / rate
+            if t_audio < cooldown_until:
+                for tr in self.trackers: tr.reset()
+                continue
+
+            t0 = time.perf_counter()
+            scores = self.engine.predict(chunk)
+            self.infer_time += time.perf_counter() - t0
+            self.chunks += 1
+
+            fired = [tr for tr in self.trackers if tr.update(scores.get(tr.name, 0.0))]
+            if fired:
+                winner = max(fired, key=lambda tr: scores.get(tr.name, 0.0))
+                detections.append((t_audio, winner.name, scores.get(winner.name, 0.0)))
+                self.reset()
+                cooldown_until = t_audio + COOLDOWN_S
+        return detections
+
+def avaliar_positivos(replay, pasta):
+    wavs = sorted(glob.glob(os.path.join(pasta, "*.wav")))
+    if not wavs: print(f"⚠️ Sem WAVs em '{pasta}'"); return None
+    falhas, latencias = 0, []
+    for path in wavs:
+        audio, rate = ler_wav(path)
+        pad = np.zeros(int(PAD_S * rate), dtype=np.int16)
+        replay.reset()
+        dets = replay.run(np.concatenate([pad, audio, pad]), rate)
+        if not dets: falhas += 1; continue
+        # Latência = quanto tempo depois do fim da palavra a hotword disparou
+        fim_fala = PAD_S + len(audio) / rate
+        latencias.append((dets[0][0] - fim_fala) * 1000)
+    return {"ficheiros": len(wavs), "falhas": falhas, "latencias": latencias}
+
+def avaliar_negativos(replay, pasta):
+    wavs = sorted(glob.glob(os.path.join(pasta, "*.wav")))
+    if not wavs: print(f"⚠️ Sem WAVs em '{pasta}'"); return None
+    segundos, falsos = 0.0, []
+    replay.reset()
+    for path in wavs:
+        audio, rate = ler_wav(path)
+        segundos += len(audio) / rate
+        for t, model, score in replay.run(audio, rate): falsos.append((os.path.basename(path), t, model, score))
+    return {"ficheiros": len(wavs), "horas": segundos / 3600, "falsos": falsos}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline da hotword (replay de WAVs pelo caminho do main()).")
+    parser.add_argument("--models", nargs="+", default=config.WAKEWORD_MODELS, help="Modelos .onnx (ex: saídas do treinar.py)")
+    parser.add_argument("--positives", default=PASTA_POSITIVOS)
+    parser.add_argument("--negatives", default=PASTA_NEGATIVOS)
+    parser.add_argument("--confidence", type=float, nargs="+", default=[None], help="Um ou mais thresholds a comparar")
+    parser.add_argument("--persistence", type=int, default=None)
+    parser.add_argument("--patience", type=int, default=None)
+    parser.add_argument("--no-gate", action="store_true", help="Desliga o pré-filtro de silêncio")
+    args = parser.parse_args()
+
+    print(f"\n--- BENCHMARK HOTWORD ---")
+    print(f"🧠 Modelos: {args.models}")
+    for conf in args.confidence:
+        replay = Replay(args.models, {"threshold": conf, "persistence": args.persistence, "max_patience": args.patience}, not args.no_gate)
+        tr = replay.trackers[0]
+        print(f"\n🎚️  Threshold {tr.threshold} | Persistence {tr.persistence} | Paciência {tr.max_patience} | Gate {'off' if args.no_gate else 'on'}")
+
+        t0 = time.perf_counter()
+        pos = avaliar_positivos(replay, args.positives)
+        neg = avaliar_negativos(replay, args.negatives)
+        wall = time.perf_counter() - t0
+
+        if pos:
+            frr = pos["falhas"] / pos["ficheiros"] * 100
+            print(f"   ✅ Positivos: {pos['ficheiros']} | Falsas rejeições: {pos['falhas']} ({frr:.1f}%)")
+            if pos["latencias"]:
+                p50, p90 = np.percentile(pos["latencias"], [50, 90])
+                print(f"   ⏱️  Latência de deteção (após fim da palavra): p50 {p50:.0f} ms | p90 {p90:.0f} ms")
+        if neg:
+            fa_h = len(neg["falsos"]) / neg["horas"] if neg["horas"] else 0.0
+            print(f"   🚫 Negativos: {neg['horas'] * 60:.1f} min | Falsos alarmes: {len(neg['falsos'])} ({fa_h:.2f}/hora)")
+            for nome, t, model, score in neg["falsos"][:10]: print(f"      - {nome} @ {t:.1f}s ({model}, {score:.2f})")
+        if replay.chunks:
+            per_chunk = replay.infer_time / replay.chunks * 1000
+            print(f"   🚀 Throughput: {replay.chunks / wall:.0f} chunks/s | {per_chunk:.2f} ms/chunk | "
+                  f"{per_chunk / (CHUNK_SIZE / 16):.3f}x tempo real")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+import random
+import argparse
+
+# Permite importar os módulos do Phantasma a partir da pasta tools/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from routing_utils import NaiveBayes, RetrievalClassifier
+
+# CONFIGURAÇÕES
+BASE_DIR = getattr(config, 'BASE_DIR', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LOG_PATH = getattr(config, 'RETRIEVAL_LOG_PATH', None) or os.path.join(BASE_DIR, "contexto_log.jsonl")  # Lê também o rodado (.1)
+ANOTACOES_PATH = os.path.join(BASE_DIR, "contexto_anotado.jsonl")  # {"prompt", "memory", "web"} por linha
+MODEL_PATH = getattr(config, 'RETRIEVAL_MODEL_PATH', None) or os.path.join(BASE_DIR, "models/contexto_nb.json")
+FOLDS = 5  # Validação cruzada para estimar a precisão antes de gravar
+
+def ler_jsonl(path):
+    if not os.path.exists(path): return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(l) for l in f if l.strip()]
+
+def sugestao(entry):
+    """ Palpite para acelerar a anotação: a decisão tomada, corrigida pelo que a recolha realmente trouxe. """
+    d = entry.get("decision", {})
+    return {"memory": bool(d.get("memory") and entry.get("rag_hits", True)),
+            "web": bool(d.get("web") and entry.get("web_hits", True) and not entry.get("skill"))}
+
+def perguntar(label, default):
+    r = input(f"   {label}? [{'S/n' if default else 's/N'}/q] ").strip().lower()
+    if r == "q": raise KeyboardInterrupt
+    return default if not r else r.startswith("s")
+
+def anotar():
+    """ Pergunta memória/web para cada prompt do log ainda não anotado. Enter aceita a sugestão. """
+    feitos = {a["prompt"] for a in ler_jsonl(ANOTACOES_PATH)}
+    novos, vistos = [], set()
+    for e in ler_jsonl(f"{LOG_PATH}.1") + ler_jsonl(LOG_PATH):
+        p = e.get("prompt", "").strip()
+        if p and p not in feitos and p not in vistos: novos.append(e); vistos.add(p)
+    print(f"📝 {len(novos)} prompts por anotar (q para parar e gravar)")
+    anotados = 0
+    try:
+        with open(ANOTACOES_PATH, "a", encoding="utf-8") as f:
+            for e in novos:
+                s = sugestao(e)
+                print(f"\n💬 {e['prompt']}")
+                a = {"prompt": e["prompt"].strip(), "memory": perguntar("Precisa de memórias", s["memory"]),
+                     "web": perguntar("Precisa de web", s["web"])}
+                f.write(json.dumps(a, ensure_ascii=False) + "\n"); f.flush()
+                anotados += 1
+    except (KeyboardInterrupt, EOFError): print()
+    print(f"✅ {anotados} anotações gravadas em {ANOTACOES_PATH}")
+
+def validar(samples):
+    """ Precisão por validação cruzada (FOLDS partes). """
+    if len(samples) < FOLDS * 2: return None
+    data = samples[:]
+    random.Random(42).shuffle(data)
+    certos = 0
+    for k in range(FOLDS):
+        teste = data[k::FOLDS]
+        treino = [s for i, s in enumerate(data) if i % FOLDS != k]
+        nb = NaiveBayes().fit(treino)
+        for p, y in teste:
+            pr = nb.prob(p) # None = o modelo não tem exemplos das duas classes
+            certos += ((0.5 if pr is None else pr) >= 0.5) == y
+    return certos / len(data)
+
+def treinar():
+    anot = ler_jsonl(ANOTACOES_PATH)
+    if not anot: print(f"❌ Sem anotações em {ANOTACOES_PATH}. Corre primeiro com --anotar."); return
+    modelo = {}
+    for kind in ("memory", "web"):
+        samples = [(a["prompt"].lower(), bool(a[kind])) for a in anot if kind in a]
+        pos = sum(1 for _, y in samples if y)
+        acc = validar(samples)
+        print(f"📊 {kind}: {len(samples)} exemplos ({pos} sim / {len(samples) - pos} não) | "
+              f"precisão {f'{acc:.1%}' if acc is not None else 'n/d (poucos exemplos)'}")
+        modelo[kind] = NaiveBayes().fit(samples).to_dict()
+    os.makedirs(os.path.dirname(MODEL_PATH) or ".", exist_ok=True)
+    with open(MODEL_PATH, "w", encoding="utf-8") as f: json.dump(modelo, f, ensure_ascii=False)
+    print(f"💾 Modelo gravado em {MODEL_PATH}")
+
+    # Quanto do tráfego real passa a dispensar cada fonte
+    clf = RetrievalClassifier(MODEL_PATH)
+    decisoes = [clf.decide(a["prompt"]) for a in anot]
+    for kind in ("memory", "web"):
+        poupados = sum(1 for d in decisoes if not d[kind])
+        print(f"   {kind}: dispensado em {poupados}/{len(decisoes)} prompts anotados")
+
+def main():
+    parser = argparse.ArgumentParser(description="Anota o log de contexto e treina o classificador memórias/web.")
+    parser.add_argument("--anotar", action="store_true", help="Anota os prompts novos do log antes de treinar")
+    parser.add_argument("--so-anotar", action="store_true", help="Só anota, não treina")
+    args = parser.parse_args()
+    print("\n--- CLASSIFICADOR DE CONTEXTO ---")
+    if args.anotar or args.so_anotar: anotar()
+    if not args.so_anotar: treinar()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import os
+import numpy as np
+import config
+
+try: import webrtcvad
+except ImportError: webrtcvad = None
+
+# --- PRÉ-FILTRO DE SILÊNCIO ---
+class SpeechGate:
+    """
+    Porta barata (RMS + webrtcvad) à frente do openWakeWord. Em silêncio o chunk não
+    passa pelo melspectrogram/embedding; fica guardado num pré-roll circular que é
+    injetado no modelo quando a porta abre, para o buffer interno de features ver
+    áudio contínuo e não perdermos a primeira sílaba da hotword.
+    """
+    def __init__(self, chunk_size=1280, rms_threshold=100, vad_mode=2, hangover_chunks=12, preroll_chunks=4):
+        self.rms_threshold = rms_threshold
+        self.vad = webrtcvad.Vad(vad_mode) if webrtcvad else None
+        self.vad_frame = 320 # 20ms a 16kHz (tamanho aceite pelo webrtcvad)
+        self.hangover_chunks = hangover_chunks
+        self.hangover = 0
+        self.preroll = np.zeros((max(preroll_chunks, 1), chunk_size), dtype=np.int16)
+        self.preroll_lens = [0] * len(self.preroll)
+        self.preroll_count = 0
+        self.preroll_next = 0
+        self.skipped = 0
+        self.passed = 0
+
+    def _is_active(self, chunk):
+        rms = np.sqrt(np.mean(np.square(chunk, dtype=np.float32)))
+        if rms < self.rms_threshold: return False
+        if self.vad is None: return True
+        for i in range(0, len(chunk) - self.vad_frame + 1, self.vad_frame):
+            try:
+                if self.vad.is_speech(chunk[i:i + self.vad_frame].tobytes(), 16000): return True
+            except Exception: return True # Na dúvida, deixa passar
+        return False
+
+    def check(self, chunk):
+        """ True se o chunk deve ir à inferência. Em silêncio guarda-o no pré-roll. """
+        if self._is_active(chunk): self.hangover = self.hangover_chunks
+        elif self.hangover > 0: self.hangover -= 1
+        else:
+            slot = self.preroll_next
+            n = min(len(chunk), self.preroll.shape[1])
+            self.preroll[slot, :n] = chunk[:n]; self.preroll_lens[slot] = n
+            self.preroll_next = (slot + 1) % len(self.preroll)
+            self.preroll_count = min(self.preroll_count + 1, len(self.preroll))
+            self.skipped += 1
+            return False
+        self.passed += 1
+        return True
+
+    def drain(self):
+        """ Devolve (por ordem) os chunks de silêncio guardados e esvazia o pré-roll. """
+        size = len(self.preroll)
+        start = (self.preroll_next - self.preroll_count) % size
+        chunks = [self.preroll[(start + i) % size, :self.preroll_lens[(start + i) % size]] for i in range(self.preroll_count)]
+        self.preroll_count = 0
+        return chunks
+
+    def reset(self):
+        self.hangover = 0
+        self.preroll_count = 0
+
+# --- MOTOR PHANTASMA ---
+class PhantasmaEngine:
+    """
+    Envolve o openWakeWord. Uma única chamada predict() por chunk: o melspectrogram
+    e os embeddings são calculados uma vez e partilhados por todos os modelos,
+    só a cabeça de classificação (pequena) corre por modelo.
+    """
+    def __init__(self, model_paths, gate=None):
+        self.ready = False
+        self.model_names = []
+        self.gate = gate
+        self.silent_scores = {}
+        self.last_scored = False # False quando a porta saltou a inferência no último predict()
+        try:
+            from openwakeword.model import Model
+            # Carrega modelos ONNX
+            self.model = Model(wakeword_models=model_paths, inference_framework="onnx")
+            self.model_names = list(self.model.models.keys())
+            self.silent_scores = {name: 0.0 for name in self.model_names}
+            self.ready = True
+            print(f"👻 Motor Phantasma: ONLINE")
+            print(f"   Modelos: {self.model_names}")
+        except Exception as e:
+            print(f"❌ Erro Motor: {e}")
+
+    def predict(self, audio_chunk_int16):
+        """ Devolve {modelo: score} para o chunk (todos os modelos de uma vez). Ver last_scored. """
+        self.last_scored = False
+        if not self.ready: return {}
+        if self.gate is not None:
+            if not self.gate.check(audio_chunk_int16): return self.silent_scores
+            # A porta abriu: o modelo primeiro "ouve" o silêncio recente para manter o contexto
+            for old in self.gate.drain(): self.model.predict(old)
+        # openWakeWord espera int16 ou float32
+        self.last_scored = True
+        return self.model.predict(audio_chunk_int16) or {}
+
+    def reset(self):
+        if self.ready: self.model.reset()
+        if self.gate is not None: self.gate.reset()
+
+def build_gate(chunk_size=1280):
+    """ Cria a SpeechGate a partir do config (None se WAKEWORD_GATE estiver desligado). """
+    if not getattr(config, 'WAKEWORD_GATE', True): return None
+    chunk_ms = chunk_size * 1000 // 16000
+    return SpeechGate(
+        chunk_size,
+        rms_threshold=getattr(config, 'WAKEWORD_GATE_RMS', 100),
+        vad_mode=getattr(config, 'WAKEWORD_GATE_VAD_MODE', 2),
+        hangover_chunks=getattr(config, 'WAKEWORD_GATE_HANGOVER_MS', 1000) // chunk_ms,
+        preroll_chunks=getattr(config, 'WAKEWORD_GATE_PREROLL_MS', 320) // chunk_ms,
+    )
+
+# --- LÓGICA DE DETEÇÃO (Streak + Paciência) ---
+class WakewordTracker:
+    """ Estado de deteção de um modelo: threshold, persistência e tolerância a falhas breves. """
+    def __init__(self, name, threshold=0.7, persistence=4, patience=2, action="listen"):
+        self.name = name
+        self.threshold = threshold
+        self.persistence = persistence
+        self.max_patience = patience # Quantos frames podemos "perder" sem zerar o streak
+        self.action = action
+        self.streak = 0
+        self.patience = 0
+        self.last_event = None # 'start' | 'patience' | 'broken' (para a telemetria)
+
+    def update(self, score):
+        """ Atualiza com o score do chunk. Retorna True quando a hotword dispara. """
+        self.last_event = None
+        if score >= self.threshold:
+            if self.streak == 0: self.last_event = 'start'
+            self.streak += 1
+            self.patience = self.max_patience # Reset da paciência se acertou
+        elif self.streak > 0 and self.patience > 0:
+            self.patience -= 1 # Não zera o streak, apenas gasta paciência
+            self.last_event = 'patience'
+        else:
+            if self.streak > 0: self.last_event = 'broken'
+            self.streak = 0
+            self.patience = 0 # Zera tudo
+        return self.streak >= self.persistence
+
+    def reset(self):
+        self.streak = 0
+        self.patience = 0
+
+def _model_settings(name):
+    """ Procura a config do modelo em WAKEWORD_SETTINGS (nome exato ou prefixo, ex: 'hey_jarvis' -> 'hey_jarvis_v0.1'). """
+    settings = getattr(config, 'WAKEWORD_SETTINGS', {}) or {}
+    if name in settings: return settings[name]
+    for key, value in settings.items():
+        if name.startswith(key) or name == os.path.splitext(os.path.basename(key))[0]: return value
+    return {}
+
+def build_trackers(model_names):
+    """ Cria um tracker por modelo, com os valores globais como default. """
+    trackers = []
+    for name in model_names:
+        s = _model_settings(name)
+        trackers.append(WakewordTracker(
+            name,
+            threshold=s.get('confidence', getattr(config, 'WAKEWORD_CONFIDENCE', 0.7)),
+            persistence=s.get('persistence', getattr(config, 'WAKEWORD_PERSISTENCE', 4)),
+            patience=s.get('patience', getattr(config, 'WAKEWORD_PATIENCE', 2)),
+            action=s.get('action', "listen"),
+        ))
+    return trackers